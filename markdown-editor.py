@@ -2,11 +2,20 @@
 
 import sys
 import os
+import atexit
 import traceback
 import re
+import io
 import json
 import locale
 import gettext
+import importlib.util
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
 from html.parser import HTMLParser
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -22,11 +31,83 @@ except Exception as e:
     print(f"{_('Specific error')}: {e}")
     sys.exit(1)
 
+# python-markdown is only imported by the first render that needs it
+# (never when cmarkgfm is installed); here we just check it is there
+MARKDOWN_AVAILABLE = importlib.util.find_spec("markdown") is not None
+
+try:
+    import cmarkgfm
+    from cmarkgfm.cmark import Options as CmarkOptions
+    CMARKGFM_AVAILABLE = True
+except ImportError:
+    CMARKGFM_AVAILABLE = False
+
 try:
-    import markdown
-    MARKDOWN_AVAILABLE = True
+    import lxml.html
+    LXML_AVAILABLE = True
 except ImportError:
-    MARKDOWN_AVAILABLE = False
+    LXML_AVAILABLE = False
+
+MARKDOWN_EXTENSIONS = [
+    'tables',
+    'fenced_code',
+    'sane_lists',
+    'nl2br',
+    'smarty',
+]
+
+# cmark-gfm equivalents of MARKDOWN_EXTENSIONS (hard breaks = nl2br, smart = smarty).
+# Raw HTML is passed through like python-markdown does; the Pango conversion
+# escapes all text, so it cannot inject markup
+CMARK_EXTENSIONS = ['table', 'strikethrough']
+CMARK_OPTIONS = (CmarkOptions.CMARK_OPT_HARDBREAKS | CmarkOptions.CMARK_OPT_SMART
+                 | CmarkOptions.CMARK_OPT_UNSAFE
+                 if CMARKGFM_AVAILABLE else 0)
+
+# Delay between the last keystroke and the preview re-render
+PREVIEW_UPDATE_DELAY_MS = 100
+# Delay between the last edit and searching the document again
+SEARCH_UPDATE_DELAY_MS = 150
+# Matches this many characters before or after the visible text are
+# highlighted too, the rest only once scrolled near
+SEARCH_HIGHLIGHT_MARGIN = 2000
+# Anonymous tags the preview buffer may collect from replaced text before
+# it is rebuilt (at least this many, or twice what a full render creates)
+PREVIEW_MIN_TAG_LIMIT = 1000
+
+# List items Enter continues, with the marker that starts the next item
+# ('{}' takes the next number). Task items go before the plain '-' item,
+# which would match them too
+LIST_CONTINUATIONS = [
+    (re.compile(r'^(\s*)-\s+\[\s*\]\s+(.*)$'), '- [ ] '),
+    (re.compile(r'^(\s*)-\s+\[x\]\s+(.*)$'), '- [ ] '),
+    (re.compile(r'^(\s*)(\d+)\.\s+(.*)$'), '{}. '),
+    (re.compile(r'^(\s*)-\s+(.*)$'), '- '),
+    (re.compile(r'^(\s*)\*\s+(.*)$'), '* '),
+    (re.compile(r'^(\s*)\+\s+(.*)$'), '+ '),
+]
+
+def find_match_starts(text, term):
+    """Start offsets of every match of term in text, packed as ints.
+
+    Matched case-insensitively on the text itself: no lowered copy of the
+    document, and offsets stay right where lower() would change a length
+    ('İ'). The lookahead keeps overlapping matches. Every match is as long
+    as the term, so only the starts are returned.
+    """
+    pattern = re.compile('(?=' + re.escape(term) + ')', re.IGNORECASE)
+    return array('i', (match.start() for match in pattern.finditer(text)))
+
+# Keyboard shortcuts for the window actions added in setup_shortcuts
+SHORTCUT_ACCELS = [
+    ("win.bold", "<Control>b"),
+    ("win.italic", "<Control>i"),
+    ("win.link", "<Control>k"),
+    ("win.new", "<Control>n"),
+    ("win.open", "<Control>o"),
+    ("win.save", "<Control>s"),
+    ("win.search", "<Control>f"),
+]
 
 # Configuración de internacionalización - Compatible con Flatpak
 def get_locale_dir():
@@ -50,6 +131,8 @@ DOMAIN = "markdown-editor"
 
 CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".config", "markdown-editor")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
+# Settings changes are written to disk at most once per this interval
+CONFIG_SAVE_DELAY_SECONDS = 2
 
 def setup_locale(language=None):
     """Configurar el idioma de la aplicación - Compatible con Flatpak"""
@@ -94,6 +177,13 @@ def setup_locale(language=None):
 # Configurar idioma inicial
 _ = setup_locale()
 
+def refresh_translations():
+    """Traducir una sola vez por idioma los textos que usa el renderizado"""
+    global TR_IMAGE
+    TR_IMAGE = _("Image")
+
+refresh_translations()
+
 # Función simple para obtener idiomas disponibles
 def get_available_languages():
     """Obtener lista de idiomas disponibles"""
@@ -108,8 +198,44 @@ def change_language_global(language_code):
     """Cambiar idioma dinámicamente"""
     global _
     _ = setup_locale(language_code if language_code != "auto" else None)
+    refresh_translations()
+    # Rendered markup embeds translated text. The caches are cleared on the
+    # render worker, after any render still running in the old language
+    executor = EditorActionsMixin.preview_executor
+    if executor is None:
+        RendererFactory.clear_caches()
+    else:
+        executor.submit(RendererFactory.clear_caches)
     return _
 
+def write_file_atomic(path, data, sync=False):
+    """Write bytes to a new temporary file next to path and rename it over
+    path, so a crash mid-write never leaves a truncated file behind"""
+    directory, name = os.path.split(path)
+    fd, tmp_file = tempfile.mkstemp(dir=directory or None, prefix=f".{name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        # mkstemp creates the file private; keep the permissions of the
+        # file being replaced, or the usual ones for a new file
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+        raise
+
 class Config:
     def __init__(self):
         self.config = {
@@ -120,25 +246,31 @@ class Config:
             "language": "auto",
             "render_style": "default",
         }
+        # Writes are batched: set() only marks the config dirty and the
+        # file is written once things settle, on close or at exit
+        self.dirty = False
+        self.save_source_id = 0
         try:
             self.load_config()
         except Exception:
             pass
+        atexit.register(self.flush)
     
     def load_config(self):
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                    loaded_config = json.load(f)
-                    self.config.update(loaded_config)
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Error loading configuration: {e}")
+        try:
+            with open(CONFIG_FILE, "rb") as f:
+                loaded_config = json.loads(f.read())
+                self.config.update(loaded_config)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error loading configuration: {e}")
     
     def save_config(self):
         try:
             os.makedirs(CONFIG_DIR, exist_ok=True)
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
+            data = json.dumps(self.config, indent=2, ensure_ascii=False).encode("utf-8")
+            write_file_atomic(CONFIG_FILE, data)
         except Exception as e:
             print(f"Error saving configuration: {e}")
     
@@ -146,975 +278,924 @@ class Config:
         return self.config.get(key, default)
     
     def set(self, key, value):
+        if key in self.config and self.config[key] == value:
+            return
         self.config[key] = value
-        self.save_config()
+        self.dirty = True
+        if not self.save_source_id:
+            self.save_source_id = GLib.timeout_add_seconds(CONFIG_SAVE_DELAY_SECONDS, self.on_save_timeout)
+
+    def on_save_timeout(self):
+        self.save_source_id = 0
+        self.flush()
+        return False
+
+    def flush(self):
+        if self.dirty:
+            self.dirty = False
+            self.save_config()
+
+NEWLINE_RUN_RE = re.compile(r'\n{3,}')
+CHECKBOX_RE = re.compile(r'^(\s*)\[([ xX])\](?:\s+(.*)|$)')
+STRIKE_RE = re.compile(r'~~([^~]+?)~~')
+# A comment, CDATA section, declaration (<!DOCTYPE>) or processing
+# instruction, all dropped, or a start/end tag with its attributes and the
+# self-closing slash
+HTML_TOKEN_RE = re.compile(
+    r'<(?:!--.*?-->|!\[CDATA\[.*?\]\]>|[!?][^>]*>'
+    r'|(/)?([a-zA-Z][^\t\n\r\f />\x00]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*?)(/)?>)', re.S)
+# End of the raw text of <script> and <style>, as HTMLParser finds it
+RAW_TEXT_END_RES = {
+    tag: re.compile(r'</\s*%s\s*>' % tag, re.I) for tag in HTMLParser.CDATA_CONTENT_ELEMENTS
+}
+# Tags of Pango markup, removed to show a segment as plain text
+PANGO_TAG_RE = re.compile(r'<[^>]*>')
+HTML_ATTR_RE = re.compile(r'([^\s/>=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]*)))?')
+def escape_xml(text):
+    """Escape &, < and > for Pango markup"""
+    # Most text needs no escaping, so check before copying it. str.replace
+    # beats str.translate here: a table with multi-character replacements
+    # makes translate fall back to a slow per-character path
+    if '&' in text or '<' in text or '>' in text:
+        return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return text
+
+# h3-h6 font sizes; GitHub and GitLab scale them up
+HEADING_SIZES = {3: "18000", 4: "16000", 5: "14000", 6: "12000"}
+GITHUB_HEADING_SIZES = {3: "20000", 4: "18000", 5: "16000", 6: "14000"}
+GITLAB_HEADING_SIZES = {3: "19000", 4: "17000", 5: "15000", 6: "13000"}
+
+BASIC_HEADING_OPENINGS = {
+    level: f'<span size="{size}" weight="bold">'
+    for level, size in {1: "24000", 2: "20000", **HEADING_SIZES}.items()
+}
+
+# Inline markup handled by _basic_render. Bold goes first, on its own, so
+# italics wrapping bold text still match; the rest share a single pass
+BOLD_RE = re.compile(r'\*\*([^*\n]+?)\*\*')
+# Characters any inline pattern starts with; lines without them are
+# returned as they are
+INLINE_MARKUP_RE = re.compile(r'[*`~\[]')
+INLINE_PATTERNS = {
+    'italic': r'(?<!\*)\*(?P<italic>[^*\n]+?)\*(?!\*)',
+    'code': r'`(?P<code>[^`\n]+?)`',
+    'strike': r'~~(?P<strike>[^~\n]+?)~~',
+    'link': r'\[(?P<link>[^\]]+?)\]\([^)]+?\)',
+}
+
+class InlineFormatter:
+    """Wrap inline markup of escaped text in a style's (opening, closing) markup"""
+    def __init__(self, templates):
+        self.bold = r'\1'.join(templates['bold'])
+        self.templates = templates
+        self.pattern = re.compile('|'.join(
+            pattern for kind, pattern in INLINE_PATTERNS.items() if kind in templates
+        ))
+
+    def format(self, text):
+        # The separate bold pass only runs when there can be bold text
+        if '**' in text:
+            text = BOLD_RE.sub(self.bold, text)
+        return self.format_spans(text)
+
+    def format_spans(self, text):
+        # Matched content is formatted too, so `code` or links nest as before
+        return self.pattern.sub(self.replace_span, text)
+
+    def replace_span(self, match):
+        kind = match.lastgroup
+        opening, closing = self.templates[kind]
+        return f'{opening}{self.format_spans(match.group(kind))}{closing}'
+
+# Documents with link reference definitions or raw HTML blocks are rendered
+# whole, since those constructs can reach across blank lines
+REFERENCE_DEF_RE = re.compile(r'^ {0,3}\[[^\]]+\]:', re.M)
+HTML_BLOCK_RE = re.compile(r'^\s*<', re.M)
+# A line starting with one of these may continue the block above it even
+# after a blank line (lists, indented code, quotes, tables)
+BLOCK_CONTINUATION_CHARS = ' \t-*+>0123456789|'
+
+def split_markdown_blocks(text):
+    """Split markdown into top-level blocks that render the same on their own"""
+    if REFERENCE_DEF_RE.search(text) or HTML_BLOCK_RE.search(text):
+        return [text]
+    blocks = []
+    current = []
+    has_content = False
+    after_blank = False
+    fence = None
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if (fence is None and after_blank and has_content and stripped
+                and line[0] not in BLOCK_CONTINUATION_CHARS):
+            blocks.append('\n'.join(current))
+            current = []
+            has_content = False
+        if fence is not None:
+            # Only a run of the fence character at least as long as the
+            # opening one closes it; "``` text" is content of the block
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+            after_blank = False
+        else:
+            if stripped.startswith('```') or stripped.startswith('~~~'):
+                fence = stripped[:len(stripped) - len(stripped.lstrip(stripped[0]))]
+            after_blank = not stripped
+        has_content = has_content or bool(stripped)
+        current.append(line)
+    blocks.append('\n'.join(current))
+    return blocks
+
+def split_pango_segments(markup):
+    """Split Pango markup at blank lines outside any tag, into pieces that
+    are valid markup on their own and join back into the whole"""
+    segments = []
+    pending = []
+    open_tags = 0
+    parts = markup.split('\n\n')
+    last = len(parts) - 1
+    for index, part in enumerate(parts):
+        pending.append(part if index == last else part + '\n\n')
+        # Tags start with '<' and end tags with '</'; text has them escaped
+        open_tags += part.count('<') - 2 * part.count('</')
+        if open_tags == 0 or index == last:
+            segments.append(''.join(pending))
+            pending = []
+    return segments
+
+# Horizontal rules used for <hr> and under h1/h2
+RULE = '─' * 50
+WIDE_RULE = '─' * 60
+DASHED_RULE = '╌' * 50
+
+def _pango_tag_table(h1, h2, h1_rule, strong, em, code, pre, hr, blockquote, link,
+                     heading_sizes=HEADING_SIZES):
+    """Build the tag -> (opening, closing) Pango markup table for one style"""
+    tags = {
+        'h1': (h1, '</span>\n<span foreground="' + h1_rule + '">' + WIDE_RULE + '</span>\n'),
+        'h2': (h2, '</span>\n<span foreground="#d8d8d8">' + RULE + '</span>\n'),
+        'strong': strong,
+        'b': strong,
+        'em': em,
+        'i': em,
+        'u': ('<u>', '</u>'),
+        'del': ('<s>', '</s>'),
+        's': ('<s>', '</s>'),
+        'code': (code, ' </span>'),
+        'pre': (pre, '</span>\n'),
+        'br': ('\n', ''),
+        'hr': (hr, ''),
+        'blockquote': blockquote,
+        'a': (link, '</span>'),
+        'table': ('\n<span font_family="monospace">', '</span>\n'),
+    }
+    for level, size in heading_sizes.items():
+        tags[f'h{level}'] = (f'\n<span size="{size}" weight="bold">', '</span>\n')
+    return tags
+
+# Precomputed per-style markup so the HTML parser does a single dict lookup per tag
+PANGO_TAG_STYLES = {
+    "default": _pango_tag_table(
+        h1='\n<span size="24000" weight="bold">',
+        h2='\n<span size="20000" weight="bold">',
+        h1_rule="#c9c9c9",
+        strong=('<b>', '</b>'),
+        em=('<i>', '</i>'),
+        code='<span font_family="monospace" background="#e0e0e0">',
+        pre='\n<span font_family="monospace" background="#e3e3e3">',
+        hr='\n' + RULE + '\n',
+        blockquote=('\n<span style="italic" foreground="#666666">" ', ' "</span>\n'),
+        link='<span foreground="blue" underline="single">',
+    ),
+    "github": _pango_tag_table(
+        h1='\n<span size="28000" weight="bold" foreground="#1f2328">',
+        h2='\n<span size="24000" weight="bold" foreground="#1f2328">',
+        h1_rule="#d0d7de",
+        strong=('<span weight="bold" foreground="#1f2328">', '</span>'),
+        em=('<span style="italic" foreground="#656d76">', '</span>'),
+        code='<span font_family="monospace" background="#f6f8fa" foreground="#d1242f" size="small"> ',
+        pre='\n<span font_family="monospace" background="#f6f8fa" foreground="#24292f">',
+        hr='\n<span foreground="#d1d9e0">' + RULE + '</span>\n',
+        blockquote=('\n<span style="italic" foreground="#656d76" background="#f6f8fa">▎ ', '</span>\n'),
+        link='<span foreground="#0969da" underline="single">',
+        heading_sizes=GITHUB_HEADING_SIZES,
+    ),
+    "github-light": _pango_tag_table(
+        h1='\n<span size="32000" weight="600" foreground="#1f2328">',
+        h2='\n<span size="26000" weight="600" foreground="#1f2328">',
+        h1_rule="#c9c9c9",
+        strong=('<span weight="bold" foreground="#1f2328">', '</span>'),
+        em=('<span style="italic" foreground="#656d76">', '</span>'),
+        code='<span font_family="monospace" background="#afb8c133" foreground="#d1242f" size="small"> ',
+        pre='\n<span font_family="monospace" background="#f6f8fa" foreground="#24292f">',
+        hr='\n<span foreground="#d1d9e0">' + RULE + '</span>\n',
+        blockquote=('\n<span style="italic" foreground="#656d76" background="#f6f8fa">▎ ', '</span>\n'),
+        link='<span foreground="#0969da" underline="single">',
+    ),
+    "github-dark": _pango_tag_table(
+        h1='\n<span size="32000" weight="600" foreground="#f0f6fc">',
+        h2='\n<span size="26000" weight="600" foreground="#f0f6fc">',
+        h1_rule="#c9c9c9",
+        strong=('<span weight="600" foreground="#f0f6fc">', '</span>'),
+        em=('<span style="italic" foreground="#8b949e">', '</span>'),
+        code='<span font_family="monospace" background="#6e768166" foreground="#ff7b72" size="small"> ',
+        pre='\n<span font_family="monospace" background="#161b22" foreground="#e6edf3">',
+        hr='\n<span foreground="#30363d">' + WIDE_RULE + '</span>\n',
+        blockquote=('\n<span style="italic" foreground="#8b949e" background="#161b22">▎ ', '</span>\n'),
+        link='<span foreground="#58a6ff" underline="single">',
+    ),
+    "gitlab": _pango_tag_table(
+        h1='\n<span size="28000" weight="bold" foreground="#303030">',
+        h2='\n<span size="24000" weight="bold" foreground="#303030">',
+        h1_rule="#c9c9c9",
+        strong=('<span weight="bold" foreground="#303030">', '</span>'),
+        em=('<span style="italic" foreground="#525252">', '</span>'),
+        code='<span font_family="monospace" background="#fdf2f2" foreground="#c73e1d" size="small"> ',
+        pre='\n<span font_family="monospace" background="#fbfafd" foreground="#303030">',
+        hr='\n<span foreground="#6b4fbb">' + WIDE_RULE + '</span>\n',
+        blockquote=('\n<span style="italic" foreground="#6b4fbb" background="#fbfafd">▎ ', '</span>\n'),
+        link='<span foreground="#1f75cb" underline="single" weight="medium">',
+        heading_sizes=GITLAB_HEADING_SIZES,
+    ),
+    "splendor": _pango_tag_table(
+        h1='\n<span size="36000" weight="300" foreground="#2c3e50">',
+        h2='\n<span size="28000" weight="400" foreground="#34495e">',
+        h1_rule="#c9c9c9",
+        strong=('<span weight="600" foreground="#2c3e50">', '</span>'),
+        em=('<span style="italic" foreground="#7f8c8d">', '</span>'),
+        code='<span font_family="monospace" background="#ecf0f1" foreground="#e74c3c" size="small"> ',
+        pre='\n<span font_family="monospace" background="#fafafa" foreground="#333">',
+        hr='\n<span foreground="#bdc3c7">' + DASHED_RULE + '</span>\n',
+        blockquote=('\n<span style="italic" foreground="#7f8c8d" background="#ecf0f1">" ', '</span>\n'),
+        link='<span foreground="#3498db" underline="single">',
+    ),
+    "modest": _pango_tag_table(
+        h1='\n<span size="28000" weight="bold" foreground="#333">',
+        h2='\n<span size="24000" weight="bold" foreground="#444">',
+        h1_rule="#c9c9c9",
+        strong=('<span weight="bold" foreground="#333">', '</span>'),
+        em=('<span style="italic" foreground="#666">', '</span>'),
+        code='<span font_family="monospace" background="#f5f5f5" foreground="#d14" size="small"> ',
+        pre='\n<span font_family="monospace" background="#f5f5f5" foreground="#333">',
+        hr='\n' + RULE + '\n',
+        blockquote=('\n<span style="italic" foreground="#777" background="#f9f9f9">│ ', '</span>\n'),
+        link='<span foreground="#337ab7" underline="single">',
+    ),
+    "retro": _pango_tag_table(
+        h1='\n<span size="30000" weight="bold" foreground="#8b4513">',
+        h2='\n<span size="26000" weight="bold" foreground="#a0522d">',
+        h1_rule="#c9c9c9",
+        strong=('<span weight="bold" foreground="#8b4513">', '</span>'),
+        em=('<span style="italic" foreground="#8b7355">', '</span>'),
+        code='<span font_family="monospace" background="#eee8d5" foreground="#b58900" size="small"> ',
+        pre='\n<span font_family="monospace" background="#eee8d5" foreground="#657b83">',
+        hr='\n<span foreground="#cd853f">' + DASHED_RULE + '</span>\n',
+        blockquote=('\n<span style="italic" foreground="#8b7355" background="#f5f5dc">▌ ', '</span>\n'),
+        link='<span foreground="#268bd2" underline="single">',
+    ),
+    "air": _pango_tag_table(
+        h1='\n<span size="32000" weight="300" foreground="#2aa198">',
+        h2='\n<span size="26000" weight="400" foreground="#268bd2">',
+        h1_rule="#c9c9c9",
+        strong=('<span weight="600" foreground="#2aa198">', '</span>'),
+        em=('<span style="italic" foreground="#586e75">', '</span>'),
+        code='<span font_family="monospace" background="#eee8d5" foreground="#cb4b16" size="small"> ',
+        pre='\n<span font_family="monospace" background="#fafafa" foreground="#586e75">',
+        hr='\n' + RULE + '\n',
+        blockquote=('\n<span style="italic" foreground="#93a1a1" background="#fdf6e3">  ', '</span>\n'),
+        link='<span foreground="#268bd2" underline="single">',
+    ),
+}
+
+# List bullets and task checkboxes, tinted with the style's text color
+LIST_MARKER_COLORS = {
+    "github": "#1f2328",
+    "github-light": "#1f2328",
+    "github-dark": "#f0f6fc",
+    "gitlab": "#303030",
+    "splendor": "#2c3e50",
+    "modest": "#333",
+    "retro": "#8b4513",
+    "air": "#268bd2",
+}
+
+def _list_markers(color):
+    markers = {'ul': "• ", 'ol': "{}. ", 'checked': "☑ ", 'unchecked': "☐ "}
+    if color:
+        markers = {kind: f'<span foreground="{color}">{marker}</span>' for kind, marker in markers.items()}
+    return markers
+
+LIST_MARKER_STYLES = {style: _list_markers(LIST_MARKER_COLORS.get(style)) for style in PANGO_TAG_STYLES}
+
+class LRUCache:
+    """Small least-recently-used mapping used to memoize render results"""
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is not None:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+class HTMLToPangoParser(HTMLParser):
+    def __init__(self, style):
+        super().__init__()
+        self.output = io.StringIO()
+        self.last_fragment = None
+        self.pending_whitespace = ''
+        self.started = False
+        self.tag_stack = []
+        self.list_level = 0
+        # Last number written by each open <ol>
+        self.list_numbers = []
+        self.in_code_block = False
+        self.table_column = 0
+        self.style = style
+        self.tags = PANGO_TAG_STYLES.get(style, PANGO_TAG_STYLES["default"])
+        self.markers = LIST_MARKER_STYLES.get(style, LIST_MARKER_STYLES["default"])
+        self.pending_li_content = None
+
+    def write(self, text):
+        # Trailing whitespace is held back and leading whitespace dropped,
+        # so runs of 3+ newlines are collapsed and the result comes out
+        # stripped while writing instead of rescanning the output
+        self.last_fragment = text
+        text = self.pending_whitespace + text
+        body = text.rstrip()
+        self.pending_whitespace = text[len(body):]
+        if body and not self.started:
+            body = body.lstrip()
+            self.started = True
+        if body:
+            if '\n\n\n' in body:
+                body = NEWLINE_RUN_RE.sub('\n\n', body)
+            self.output.write(body)
+
+    def flush_pending_li(self):
+        if self.pending_li_content:
+            indent, marker = self.pending_li_content
+            self.write(f'{indent}{marker}')
+            self.pending_li_content = None
+
+    def handle_starttag(self, tag, attrs):
+        # The marker of an item stays pending through its first <p>, so
+        # loose items start on the marker's line and can still be tasks
+        if tag != 'li' and tag != 'p':
+            self.flush_pending_li()
+            
+        self.tag_stack.append(tag)
+        
+        if tag == 'code':
+            if not self.in_code_block:
+                self.write(self.tags['code'][0])
+        elif tag == 'pre':
+            self.in_code_block = True
+            self.write(self.tags['pre'][0])
+        elif tag == 'p':
+            if (self.pending_li_content is None and self.last_fragment is not None
+                    and not self.last_fragment.endswith('\n')):
+                self.write('\n')
+        elif tag == 'ul' or tag == 'ol':
+            self.list_level += 1
+            if tag == 'ol':
+                start = next((value for name, value in attrs if name == 'start'), None)
+                self.list_numbers.append(int(start) - 1 if start and start.isdigit() else 0)
+            self.write('\n')
+        elif tag == 'li':
+            indent = '  ' * (self.list_level - 1)
+            parent = self.tag_stack[-2] if len(self.tag_stack) > 1 else None
+            marker = self.markers['ul']
+            if parent == 'ol' and self.list_numbers:
+                self.list_numbers[-1] += 1
+                marker = self.markers['ol'].format(self.list_numbers[-1])
+            self.pending_li_content = (indent, marker)
+        elif tag == 'img':
+            alt = next((value for name, value in attrs if name == 'alt'), TR_IMAGE)
+            self.write(f'\n🖼️ [{TR_IMAGE}: {alt}]\n')
+        elif tag == 'tr':
+            self.table_column = 0
+            self.write('\n')
+        elif tag == 'td' or tag == 'th':
+            if self.table_column > 0:
+                self.write(' | ')
+            self.table_column += 1
+            if tag == 'th':
+                self.write('<b>')
+        elif tag in self.tags:
+            self.write(self.tags[tag][0])
+
+    def handle_endtag(self, tag):
+        self.flush_pending_li()
+        
+        if self.tag_stack and self.tag_stack[-1] == tag:
+            self.tag_stack.pop()
+        
+        if tag == 'code':
+            self.write('</span>' if self.in_code_block else self.tags['code'][1])
+        elif tag == 'pre':
+            self.in_code_block = False
+            self.write(self.tags['pre'][1])
+        elif tag == 'ul' or tag == 'ol':
+            self.list_level -= 1
+            if tag == 'ol' and self.list_numbers:
+                self.list_numbers.pop()
+            self.write('\n')
+        elif tag == 'p' or tag == 'li' or tag == 'div':
+            self.write('\n')
+        elif tag == 'th':
+            self.write('</b>')
+        elif tag in self.tags and self.tags[tag][1]:
+            self.write(self.tags[tag][1])
+        
+    def handle_data(self, data):
+        if self.pending_li_content:
+            # Whitespace between <li> and its first child, as in the
+            # <li>\n<p> of loose lists, would put the marker on its own line
+            if data.isspace():
+                return
+            match = CHECKBOX_RE.match(data)
+            if match:
+                indent = self.pending_li_content[0]
+                is_checked = match.group(2).lower() == 'x'
+                
+                checkbox = self.markers['checked' if is_checked else 'unchecked']
+                self.write(f'{indent}{checkbox}')
+                
+                data = data[match.end():]
+                if match.lastindex >= 3:
+                    data = match.group(3) or ""
+                    
+                # First escape data before wrapping in tags
+                data = escape_xml(data)
+                
+                if is_checked:
+                    data = f"<s>{data}</s>"
+                    
+                self.write(data)
+                self.pending_li_content = None
+                return
+            else:
+                self.flush_pending_li()
+        
+        # First escape XML characters
+        data = escape_xml(data)
+        
+        # Then process strikethrough (after escaping)
+        data = STRIKE_RE.sub(r'<s>\1</s>', data)
+        
+        self.write(data)
+        
+    def feed_tree(self, element):
+        # Same callbacks as HTMLParser.feed, driven by an already parsed
+        # lxml tree; void elements get both start and end like <br />
+        for child in element:
+            if isinstance(child.tag, str):
+                self.handle_starttag(child.tag, list(child.attrib.items()))
+                if child.text:
+                    self.handle_data(child.text)
+                self.feed_tree(child)
+                self.handle_endtag(child.tag)
+            if child.tail:
+                self.handle_data(child.tail)
+
+    def feed_markup(self, markup):
+        # Same callbacks as HTMLParser.feed for the HTML the markdown
+        # parsers produce, found with one regex scan instead of the
+        # character-level state machine. Self-closing tags (<br />) get
+        # both start and end, text comes unescaped like convert_charrefs
+        pos = 0
+        search = HTML_TOKEN_RE.search
+        while True:
+            match = search(markup, pos)
+            if match is None:
+                break
+            if match.start() > pos:
+                self.handle_data(unescape(markup[pos:match.start()]))
+            pos = match.end()
+            closing, tag, attr_text, self_closing = match.groups()
+            if tag is None:
+                continue
+            tag = tag.lower()
+            if closing:
+                self.handle_endtag(tag)
+                continue
+            attrs = []
+            if attr_text and not attr_text.isspace():
+                for attr in HTML_ATTR_RE.finditer(attr_text):
+                    name, double_quoted, single_quoted, bare = attr.groups()
+                    value = next((v for v in (double_quoted, single_quoted, bare) if v is not None), None)
+                    attrs.append((name.lower(), unescape(value) if value is not None else None))
+            self.handle_starttag(tag, attrs)
+            if self_closing:
+                self.handle_endtag(tag)
+            elif tag in RAW_TEXT_END_RES:
+                # Script and style content is text up to the end tag, with
+                # no tags or entities inside
+                end = RAW_TEXT_END_RES[tag].search(markup, pos)
+                if end is None:
+                    # Like HTMLParser, which keeps it buffered until close()
+                    return
+                if end.start() > pos:
+                    self.handle_data(markup[pos:end.start()])
+                self.handle_endtag(tag)
+                pos = end.end()
+        if pos < len(markup):
+            self.handle_data(unescape(markup[pos:]))
+
+    def get_pango(self):
+        self.flush_pending_li()
+        return self.output.getvalue()
 
 class ImprovedRenderer:
+    code_block_opening = '<span font_family="monospace" background="#e3e3e3">'
+    inline_formatter = InlineFormatter({
+        'bold': ('<b>', '</b>'),
+        'italic': ('<i>', '</i>'),
+        'code': ('<span font_family="monospace" background="#e0e0e0">', '</span>'),
+        'strike': ('<s>', '</s>'),
+        'link': ('<span foreground="blue" underline="single">', '</span>'),
+    })
+
     def __init__(self):
+        self._render_cache = LRUCache(32)
+        self._pango_cache = LRUCache(32)
+        # HTML of each markdown block, independent of the style
+        self._block_cache = LRUCache(1024)
+        self._md = None
+        # (lines, rendered lines, code block state per line) of the last
+        # _basic_render call
+        self._basic_render_state = ([], [], [False])
         self.style = "default"
 
+    @property
+    def style(self):
+        return self._style
+
+    @style.setter
+    def style(self, value):
+        # Cached output depends on the style, drop it when the style changes.
+        # Interned so the per-render table lookups compare by identity
+        self._style = sys.intern(value)
+        self.clear_caches()
+
+    def clear_caches(self):
+        # The block cache holds HTML, which depends on neither the style
+        # nor the language
+        self._render_cache.clear()
+        self._pango_cache.clear()
+
     def render_text(self, markdown_text):
+        # Nothing to render in a new or blank document
+        if not markdown_text or markdown_text.isspace():
+            return ''
+        # Keyed on the text itself: str caches its hash, and comparing on a
+        # hit rules out collisions between different documents
+        cached = self._render_cache.get(markdown_text)
+        if cached is not None:
+            return cached
+        result = self._render_uncached(markdown_text)
+        self._render_cache.put(markdown_text, result)
+        return result
+
+    def _render_uncached(self, markdown_text):
         try:
-            if MARKDOWN_AVAILABLE:
-                extensions = [
-                    'tables',
-                    'fenced_code',
-                    'sane_lists',
-                    'nl2br',
-                    'smarty',
-                ]
-                html = markdown.markdown(markdown_text, extensions=extensions)
-                return self._html_to_pango(html)
+            if CMARKGFM_AVAILABLE or MARKDOWN_AVAILABLE:
+                return self._html_to_pango(self._render_html(markdown_text))
         except Exception:
             pass
         return self._basic_render(markdown_text)
+
+    def _render_html(self, markdown_text):
+        # Only blocks edited since the last render go through the markdown
+        # parser again, the rest of the document comes from the block cache
+        html = []
+        for block in split_markdown_blocks(markdown_text):
+            block_html = self._block_cache.get(block)
+            if block_html is None:
+                block_html = self._markdown_to_html(block)
+                self._block_cache.put(block, block_html)
+            html.append(block_html)
+        # cmark terminates every block with a newline, python-markdown does not
+        return ('' if CMARKGFM_AVAILABLE else '\n').join(html)
+
+    def _markdown_to_html(self, markdown_text):
+        if CMARKGFM_AVAILABLE:
+            return cmarkgfm.markdown_to_html_with_extensions(
+                markdown_text, options=CMARK_OPTIONS, extensions=CMARK_EXTENSIONS
+            )
+        # Building Markdown registers every extension processor;
+        # do it once and only reset the per-document state
+        if self._md is None:
+            import markdown
+            self._md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+        return self._md.reset().convert(markdown_text)
     
     def _html_to_pango(self, html):
-        class HTMLToPangoParser(HTMLParser):
-            def __init__(self, style):
-                super().__init__()
-                self.output = []
-                self.tag_stack = []
-                self.list_level = 0
-                self.in_code_block = False
-                self.table_column = 0
-                self.in_heading_level = None
-                self.style = style
-                self.pending_li_content = None
+        if not html or html.isspace():
+            return ''
+        cached = self._pango_cache.get(html)
+        if cached is not None:
+            return cached
+        result = self._html_to_pango_uncached(html)
+        self._pango_cache.put(html, result)
+        return result
 
-            def flush_pending_li(self):
-                if self.pending_li_content:
-                    indent, btype = self.pending_li_content
-                    bullet = "• " if btype == 'ul' else "1. "
-                    
-                    if self.style == "github" or self.style == "github-light":
-                        bullet = f'<span foreground="#1f2328">{bullet}</span>'
-                    elif self.style == "github-dark":
-                        bullet = f'<span foreground="#f0f6fc">{bullet}</span>'
-                    elif self.style == "gitlab":
-                        bullet = f'<span foreground="#303030">{bullet}</span>'
-                    elif self.style == "splendor":
-                        bullet = f'<span foreground="#2c3e50">{bullet}</span>'
-                    elif self.style == "modest":
-                        bullet = f'<span foreground="#333">{bullet}</span>'
-                    elif self.style == "retro":
-                        bullet = f'<span foreground="#8b4513">{bullet}</span>'
-                    elif self.style == "air":
-                        bullet = f'<span foreground="#268bd2">{bullet}</span>'
-                        
-                    self.output.append(f'{indent}{bullet}')
-                    self.pending_li_content = None
-
-            def handle_starttag(self, tag, attrs):
-                if tag != 'li':
-                    self.flush_pending_li()
-                    
-                self.tag_stack.append(tag)
-                
-                if tag == 'h1':
-                    self.in_heading_level = 1
-                    if self.style == "github":
-                        self.output.append('\n<span size="28000" weight="bold" foreground="#1f2328">')
-                    elif self.style == "github-light":
-                        self.output.append('\n<span size="32000" weight="600" foreground="#1f2328">')
-                    elif self.style == "github-dark":
-                        self.output.append('\n<span size="32000" weight="600" foreground="#f0f6fc">')
-                    elif self.style == "gitlab":
-                        self.output.append('\n<span size="28000" weight="bold" foreground="#303030">')
-                    elif self.style == "splendor":
-                        self.output.append('\n<span size="36000" weight="300" foreground="#2c3e50">')
-                    elif self.style == "modest":
-                        self.output.append('\n<span size="28000" weight="bold" foreground="#333">')
-                    elif self.style == "retro":
-                        self.output.append('\n<span size="30000" weight="bold" foreground="#8b4513">')
-                    elif self.style == "air":
-                        self.output.append('\n<span size="32000" weight="300" foreground="#2aa198">')
-                    else:
-                        self.output.append('\n<span size="24000" weight="bold">')
-                elif tag == 'h2':
-                    self.in_heading_level = 2
-                    if self.style == "github":
-                        self.output.append('\n<span size="24000" weight="bold" foreground="#1f2328">')
-                    elif self.style == "github-light":
-                        self.output.append('\n<span size="26000" weight="600" foreground="#1f2328">')
-                    elif self.style == "github-dark":
-                        self.output.append('\n<span size="26000" weight="600" foreground="#f0f6fc">')
-                    elif self.style == "gitlab":
-                        self.output.append('\n<span size="24000" weight="bold" foreground="#303030">')
-                    elif self.style == "splendor":
-                        self.output.append('\n<span size="28000" weight="400" foreground="#34495e">')
-                    elif self.style == "modest":
-                        self.output.append('\n<span size="24000" weight="bold" foreground="#444">')
-                    elif self.style == "retro":
-                        self.output.append('\n<span size="26000" weight="bold" foreground="#a0522d">')
-                    elif self.style == "air":
-                        self.output.append('\n<span size="26000" weight="400" foreground="#268bd2">')
-                    else:
-                        self.output.append('\n<span size="20000" weight="bold">')
-                elif tag == 'h3':
-                    self.in_heading_level = 3
-                    size = "20000" if self.style == "github" else "19000" if self.style == "gitlab" else "18000"
-                    self.output.append(f'\n<span size="{size}" weight="bold">')
-                elif tag == 'h4':
-                    self.in_heading_level = 4
-                    size = "18000" if self.style == "github" else "17000" if self.style == "gitlab" else "16000"
-                    self.output.append(f'\n<span size="{size}" weight="bold">')
-                elif tag == 'h5':
-                    self.in_heading_level = 5
-                    size = "16000" if self.style == "github" else "15000" if self.style == "gitlab" else "14000"
-                    self.output.append(f'\n<span size="{size}" weight="bold">')
-                elif tag == 'h6':
-                    self.in_heading_level = 6
-                    size = "14000" if self.style == "github" else "13000" if self.style == "gitlab" else "12000"
-                    self.output.append(f'\n<span size="{size}" weight="bold">')
-                elif tag == 'strong' or tag == 'b':
-                    if self.style == "github" or self.style == "github-light":
-                        self.output.append('<span weight="bold" foreground="#1f2328">')
-                    elif self.style == "github-dark":
-                        self.output.append('<span weight="600" foreground="#f0f6fc">')
-                    elif self.style == "gitlab":
-                        self.output.append('<span weight="bold" foreground="#303030">')
-                    elif self.style == "splendor":
-                        self.output.append('<span weight="600" foreground="#2c3e50">')
-                    elif self.style == "modest":
-                        self.output.append('<span weight="bold" foreground="#333">')
-                    elif self.style == "retro":
-                        self.output.append('<span weight="bold" foreground="#8b4513">')
-                    elif self.style == "air":
-                        self.output.append('<span weight="600" foreground="#2aa198">')
-                    else:
-                        self.output.append('<b>')
-                elif tag == 'em' or tag == 'i':
-                    if self.style == "github" or self.style == "github-light":
-                        self.output.append('<span style="italic" foreground="#656d76">')
-                    elif self.style == "github-dark":
-                        self.output.append('<span style="italic" foreground="#8b949e">')
-                    elif self.style == "gitlab":
-                        self.output.append('<span style="italic" foreground="#525252">')
-                    elif self.style == "splendor":
-                        self.output.append('<span style="italic" foreground="#7f8c8d">')
-                    elif self.style == "modest":
-                        self.output.append('<span style="italic" foreground="#666">')
-                    elif self.style == "retro":
-                        self.output.append('<span style="italic" foreground="#8b7355">')
-                    elif self.style == "air":
-                        self.output.append('<span style="italic" foreground="#586e75">')
-                    else:
-                        self.output.append('<i>')
-                elif tag == 'u':
-                    self.output.append('<u>')
-                elif tag == 'code':
-                    if not self.in_code_block:
-                        if self.style == "github":
-                            self.output.append('<span font_family="monospace" background="#f6f8fa" foreground="#d1242f" size="small"> ')
-                        elif self.style == "github-light":
-                            self.output.append('<span font_family="monospace" background="#afb8c133" foreground="#d1242f" size="small"> ')
-                        elif self.style == "github-dark":
-                            self.output.append('<span font_family="monospace" background="#6e768166" foreground="#ff7b72" size="small"> ')
-                        elif self.style == "gitlab":
-                            self.output.append('<span font_family="monospace" background="#fdf2f2" foreground="#c73e1d" size="small"> ')
-                        elif self.style == "splendor":
-                            self.output.append('<span font_family="monospace" background="#ecf0f1" foreground="#e74c3c" size="small"> ')
-                        elif self.style == "modest":
-                            self.output.append('<span font_family="monospace" background="#f5f5f5" foreground="#d14" size="small"> ')
-                        elif self.style == "retro":
-                            self.output.append('<span font_family="monospace" background="#eee8d5" foreground="#b58900" size="small"> ')
-                        elif self.style == "air":
-                            self.output.append('<span font_family="monospace" background="#eee8d5" foreground="#cb4b16" size="small"> ')
-                        else:
-                            self.output.append('<span font_family="monospace" background="#e0e0e0">')
-                elif tag == 'pre':
-                    self.in_code_block = True
-                    if self.style == "github":
-                        self.output.append('\n<span font_family="monospace" background="#f6f8fa" foreground="#24292f">')
-                    elif self.style == "github-light":
-                        self.output.append('\n<span font_family="monospace" background="#f6f8fa" foreground="#24292f">')
-                    elif self.style == "github-dark":
-                        self.output.append('\n<span font_family="monospace" background="#161b22" foreground="#e6edf3">')
-                    elif self.style == "gitlab":
-                        self.output.append('\n<span font_family="monospace" background="#fbfafd" foreground="#303030">')
-                    elif self.style == "splendor":
-                        self.output.append('\n<span font_family="monospace" background="#fafafa" foreground="#333">')
-                    elif self.style == "modest":
-                        self.output.append('\n<span font_family="monospace" background="#f5f5f5" foreground="#333">')
-                    elif self.style == "retro":
-                        self.output.append('\n<span font_family="monospace" background="#eee8d5" foreground="#657b83">')
-                    elif self.style == "air":
-                        self.output.append('\n<span font_family="monospace" background="#fafafa" foreground="#586e75">')
-                    else:
-                        self.output.append('\n<span font_family="monospace" background="#e3e3e3">')
-                elif tag == 'p':
-                    if self.output and not self.output[-1].endswith('\n'):
-                        self.output.append('\n')
-                elif tag == 'br':
-                    self.output.append('\n')
-                elif tag == 'hr':
-                    if self.style == "github" or self.style == "github-light":
-                        self.output.append('\n<span foreground="#d1d9e0">' + '─' * 50 + '</span>\n')
-                    elif self.style == "github-dark":
-                        self.output.append('\n<span foreground="#30363d">' + '─' * 60 + '</span>\n')
-                    elif self.style == "gitlab":
-                        self.output.append('\n<span foreground="#6b4fbb">' + '─' * 60 + '</span>\n')
-                    elif self.style == "splendor":
-                        self.output.append('\n<span foreground="#bdc3c7">' + '╌' * 50 + '</span>\n')
-                    elif self.style == "retro":
-                        self.output.append('\n<span foreground="#cd853f">' + '╌' * 50 + '</span>\n')
-                    else:
-                        self.output.append('\n' + '─' * 50 + '\n')
-                elif tag == 'blockquote':
-                    if self.style == "github" or self.style == "github-light":
-                        self.output.append('\n<span style="italic" foreground="#656d76" background="#f6f8fa">▎ ')
-                    elif self.style == "github-dark":
-                        self.output.append('\n<span style="italic" foreground="#8b949e" background="#161b22">▎ ')
-                    elif self.style == "gitlab":
-                        self.output.append('\n<span style="italic" foreground="#6b4fbb" background="#fbfafd">▎ ')
-                    elif self.style == "splendor":
-                        self.output.append('\n<span style="italic" foreground="#7f8c8d" background="#ecf0f1">" ')
-                    elif self.style == "modest":
-                        self.output.append('\n<span style="italic" foreground="#777" background="#f9f9f9">│ ')
-                    elif self.style == "retro":
-                        self.output.append('\n<span style="italic" foreground="#8b7355" background="#f5f5dc">▌ ')
-                    elif self.style == "air":
-                        self.output.append('\n<span style="italic" foreground="#93a1a1" background="#fdf6e3">  ')
-                    else:
-                        self.output.append('\n<span style="italic" foreground="#666666">" ')
-                elif tag == 'ul':
-                    self.list_level += 1
-                    self.output.append('\n')
-                elif tag == 'ol':
-                    self.list_level += 1
-                    self.output.append('\n')
-                elif tag == 'li':
-                    indent = '  ' * (self.list_level - 1)
-                    parent = self.tag_stack[-2] if len(self.tag_stack) > 1 else None
-                    btype = 'ul'
-                    if parent == 'ol': btype = 'ol'
-                    self.pending_li_content = (indent, btype)
-                elif tag == 'del' or tag == 's':
-                    self.output.append('<s>')
-                elif tag == 'a':
-                    if self.style == "github" or self.style == "github-light":
-                        self.output.append('<span foreground="#0969da" underline="single">')
-                    elif self.style == "github-dark":
-                        self.output.append('<span foreground="#58a6ff" underline="single">')
-                    elif self.style == "gitlab":
-                        self.output.append('<span foreground="#1f75cb" underline="single" weight="medium">')
-                    elif self.style == "splendor":
-                        self.output.append('<span foreground="#3498db" underline="single">')
-                    elif self.style == "modest":
-                        self.output.append('<span foreground="#337ab7" underline="single">')
-                    elif self.style == "retro":
-                        self.output.append('<span foreground="#268bd2" underline="single">')
-                    elif self.style == "air":
-                        self.output.append('<span foreground="#268bd2" underline="single">')
-                    else:
-                        self.output.append('<span foreground="blue" underline="single">')
-                elif tag == 'img':
-                    alt = next((value for name, value in attrs if name == 'alt'), _('Image'))
-                    self.output.append(f'\n🖼️ [{_("Image")}: {alt}]\n')
-                elif tag == 'table':
-                    self.output.append('\n<span font_family="monospace">')
-                elif tag == 'tr':
-                    self.table_column = 0
-                    self.output.append('\n')
-                elif tag == 'td' or tag == 'th':
-                    if self.table_column > 0:
-                        self.output.append(' | ')
-                    self.table_column += 1
-                    if tag == 'th':
-                        self.output.append('<b>')
-
-            def handle_endtag(self, tag):
-                self.flush_pending_li()
-                
-                if self.tag_stack and self.tag_stack[-1] == tag:
-                    self.tag_stack.pop()
-                
-                if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                    self.output.append('</span>\n')
-                    if self.in_heading_level == 1:
-                        if self.style == "github":
-                            self.output.append('<span foreground="#d0d7de">' + '─' * 60 + '</span>\n')
-                        elif self.style == "gitlab":
-                            self.output.append('<span foreground="#c9c9c9">' + '─' * 60 + '</span>\n')
-                        else:
-                            self.output.append('<span foreground="#c9c9c9">' + '─' * 60 + '</span>\n')
-                    elif self.in_heading_level == 2:
-                        if self.style == "github":
-                            self.output.append('<span foreground="#d8d8d8">' + '─' * 50 + '</span>\n')
-                        elif self.style == "gitlab":
-                            self.output.append('<span foreground="#d8d8d8">' + '─' * 50 + '</span>\n')
-                        else:
-                            self.output.append('<span foreground="#d8d8d8">' + '─' * 50 + '</span>\n')
-                    self.in_heading_level = None
-                elif tag == 'strong' or tag == 'b':
-                    if self.style == "default":
-                        self.output.append('</b>')
-                    else:
-                        self.output.append('</span>')
-                elif tag == 'em' or tag == 'i':
-                    if self.style == "default":
-                        self.output.append('</i>')
-                    else:
-                        self.output.append('</span>')
-                elif tag == 'u':
-                    self.output.append('</u>')
-                elif tag == 'del' or tag == 's':
-                    self.output.append('</s>')
-                elif tag == 'code':
-                    if not self.in_code_block:
-                        self.output.append(' </span>')
-                    else:
-                        self.output.append('</span>')
-                elif tag == 'pre':
-                    self.in_code_block = False
-                    self.output.append('</span>\n')
-                elif tag == 'p':
-                    self.output.append('\n')
-                elif tag == 'blockquote':
-                    self.output.append(' "</span>\n' if self.style == "default" else '</span>\n')
-                elif tag == 'ul' or tag == 'ol':
-                    self.list_level -= 1
-                    self.output.append('\n')
-                elif tag == 'li':
-                    self.output.append('\n')
-                elif tag == 'a':
-                    self.output.append('</span>')
-                elif tag == 'table':
-                    self.output.append('</span>\n')
-                elif tag == 'th':
-                    self.output.append('</b>')
-                
-            def handle_data(self, data):
-                if self.pending_li_content:
-                    match = re.match(r'^(\s*)\[([ xX])\]\s+(.*)', data)
-                    if not match:
-                        match = re.match(r'^(\s*)\[([ xX])\]$', data)
-                        
-                    if match:
-                        indent, _ = self.pending_li_content
-                        is_checked = match.group(2).lower() == 'x'
-                        
-                        checkbox = "☑ " if is_checked else "☐ "
-                        
-                        if self.style == "github" or self.style == "github-light":
-                            checkbox = f'<span foreground="#1f2328">{checkbox}</span>'
-                        elif self.style == "github-dark":
-                            checkbox = f'<span foreground="#f0f6fc">{checkbox}</span>'
-                        elif self.style == "gitlab":
-                            checkbox = f'<span foreground="#303030">{checkbox}</span>'
-                        elif self.style == "splendor":
-                            checkbox = f'<span foreground="#2c3e50">{checkbox}</span>'
-                        elif self.style == "modest":
-                            checkbox = f'<span foreground="#333">{checkbox}</span>'
-                        elif self.style == "retro":
-                            checkbox = f'<span foreground="#8b4513">{checkbox}</span>'
-                        elif self.style == "air":
-                            checkbox = f'<span foreground="#268bd2">{checkbox}</span>'
-                            
-                        self.output.append(f'{indent}{checkbox}')
-                        
-                        data = data[match.end():]
-                        if match.lastindex >= 3:
-                            data = match.group(3) or ""
-                            
-                        # First escape data before wrapping in tags
-                        data = data.replace('&', '&amp;')
-                        data = data.replace('<', '&lt;')
-                        data = data.replace('>', '&gt;')
-                        
-                        if is_checked:
-                            data = f"<s>{data}</s>"
-                            
-                        self.output.append(data)
-                        self.pending_li_content = None
-                        return
-                    else:
-                        self.flush_pending_li()
-                
-                # First escape XML characters
-                data = data.replace('&', '&amp;')
-                data = data.replace('<', '&lt;')
-                data = data.replace('>', '&gt;')
-                
-                # Then process strikethrough (after escaping)
-                data = re.sub(r'~~([^~]+?)~~', r'<s>\1</s>', data)
-                
-                self.output.append(data)
-                
-            def get_pango(self):
-                self.flush_pending_li()
-                result = ''.join(self.output)
-                result = re.sub(r'\n{3,}', '\n\n', result)
-                return result.strip()
-        
+    def _html_to_pango_uncached(self, html):
+        if LXML_AVAILABLE:
+            try:
+                root = lxml.html.fragment_fromstring(html, create_parent='div')
+                parser = HTMLToPangoParser(self.style)
+                # feed_tree walks the children; text before the first
+                # element belongs to the wrapper
+                if root.text:
+                    parser.handle_data(root.text)
+                parser.feed_tree(root)
+                return parser.get_pango()
+            except Exception:
+                pass
         parser = HTMLToPangoParser(self.style)
-        parser.feed(html)
+        parser.feed_markup(html)
         return parser.get_pango()
     
     def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
+        # Escaped in one pass; escaping never adds a newline, so the lines
+        # and their markup characters other than <, > and & stay the same
+        lines = escape_xml(text).split('\n')
+        prev_lines, prev_rendered, prev_states = self._basic_render_state
+        # Lines shared with the previous call at the start and at the end
+        # keep their rendering, only the edited range is rendered again
+        limit = min(len(lines), len(prev_lines))
+        start = 0
+        while start < limit and lines[start] == prev_lines[start]:
+            start += 1
+        end = 0
+        while end < limit - start and lines[-1 - end] == prev_lines[-1 - end]:
+            end += 1
+        
+        rendered = prev_rendered[:start]
+        # states[i]: whether line i starts inside a code block
+        states = prev_states[:start + 1]
+        in_code_block = states[-1]
+        shift = len(prev_lines) - len(lines)
+        
+        for index in range(start, len(lines)):
+            # The unchanged tail is reused once it starts in the same state
+            if index >= len(lines) - end and in_code_block == prev_states[index + shift]:
+                rendered += prev_rendered[index + shift:]
+                states += prev_states[index + shift + 1:]
+                in_code_block = states[-1]
+                break
+            
+            line = lines[index]
             stripped_line = line.strip()
             
             if stripped_line.startswith('```'):
                 in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="monospace" background="#e3e3e3">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format(stripped_line[2:])
-                result.append(f'<span size="24000" weight="bold">{processed}</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format(stripped_line[3:])
-                result.append(f'<span size="20000" weight="bold">{processed}</span>')
-            elif stripped_line.startswith('### '):
-                processed = self._process_inline_format(stripped_line[4:])
-                result.append(f'<span size="18000" weight="bold">{processed}</span>')
-            elif stripped_line.startswith('#### '):
-                processed = self._process_inline_format(stripped_line[5:])
-                result.append(f'<span size="16000" weight="bold">{processed}</span>')
-            elif stripped_line.startswith('##### '):
-                processed = self._process_inline_format(stripped_line[6:])
-                result.append(f'<span size="14000" weight="bold">{processed}</span>')
-            elif stripped_line.startswith('###### '):
-                processed = self._process_inline_format(stripped_line[7:])
-                result.append(f'<span size="12000" weight="bold">{processed}</span>')
-            elif re.match(r'^[\s]*[-*+]\s+', original_line):
-                match = re.match(r'^(\s*)([-*+])\s+(.*)', original_line)
-                if match:
-                    indent_text, bullet, content = match.groups()
-                    
-                    if content.startswith('[ ]'):
-                        task_content = self._process_inline_format(content[3:].strip())
-                        result.append(f'{indent_text}☐ {task_content}')
-                    elif content.startswith('[x]') or content.startswith('[X]'):
-                        task_content = self._process_inline_format(content[3:].strip())
-                        result.append(f'{indent_text}☑ <s>{task_content}</s>')
-                    else:
-                        processed_content = self._process_inline_format(content)
-                        result.append(f'{indent_text}• {processed_content}')
-            elif re.match(r'^[\s]*\d+\.\s+', original_line):
-                match = re.match(r'^(\s*)(\d+\.)\s+(.*)', original_line)
-                if match:
-                    indent_text, number, content = match.groups()
-                    processed_content = self._process_inline_format(content)
-                    result.append(f'{indent_text}{number} {processed_content}')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#666666">" {processed} "</span>')
-            elif stripped_line.strip() == '---':
-                result.append('─' * 50)
+                rendered.append(self.code_block_opening if in_code_block else '</span>')
+            elif in_code_block:
+                rendered.append(stripped_line)
             else:
-                if stripped_line:
-                    processed = self._process_inline_format(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
+                rendered.append(self._render_line(line, stripped_line))
+            states.append(in_code_block)
         
+        self._basic_render_state = (lines, rendered, states)
+        result = '\n'.join(rendered)
         if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
+            result += '\n</span>'
+        return result
+    
+    def _render_line(self, line, stripped_line):
+        # Headings, bullets and numbered items are told apart by their first
+        # character and parsed with string methods, no regex involved
+        first = stripped_line[:1]
+        if first == '#':
+            # One to six hashes and exactly one space before the text
+            level = len(stripped_line) - len(stripped_line.lstrip('#'))
+            if level <= 6 and stripped_line[level:level + 1] == ' ':
+                processed = self._process_inline_format(stripped_line[level + 1:])
+                return f'{BASIC_HEADING_OPENINGS[level]}{processed}</span>'
+        elif first == '-' or first == '*' or first == '+':
+            item = line.lstrip()
+            if item[1:2].isspace():
+                indent_text = line[:len(line) - len(item)]
+                content = item[1:].lstrip()
+                
+                if content.startswith('[ ]'):
+                    task_content = self._process_inline_format(content[3:].strip())
+                    return f'{indent_text}☐ {task_content}'
+                if content.startswith('[x]') or content.startswith('[X]'):
+                    task_content = self._process_inline_format(content[3:].strip())
+                    return f'{indent_text}☑ <s>{task_content}</s>'
+                processed_content = self._process_inline_format(content)
+                return f'{indent_text}• {processed_content}'
+        elif first.isdigit():
+            item = line.lstrip()
+            # ASCII digits, a dot and whitespace: "12. "
+            dot = len(item) - len(item.lstrip('0123456789'))
+            if item[dot:dot + 1] == '.' and item[dot + 1:dot + 2].isspace():
+                indent_text = line[:len(line) - len(item)]
+                processed_content = self._process_inline_format(item[dot + 1:].lstrip())
+                return f'{indent_text}{item[:dot + 1]} {processed_content}'
+        if stripped_line.startswith('&gt; '):
+            processed = self._process_inline_format(stripped_line[5:])
+            return f'<span style="italic" foreground="#666666">" {processed} "</span>'
+        if stripped_line == '---':
+            return RULE
+        return self._process_inline_format(stripped_line)
     
     def _process_inline_format(self, text):
-        if not text:
+        if not INLINE_MARKUP_RE.search(text):
             return text
-            
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<b>\1</b>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<i>\1</i>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="monospace" background="#e0e0e0">\1</span>', processed)
-        processed = re.sub(r'~~([^~\n]+?)~~', r'<s>\1</s>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="blue" underline="single">\1</span>', processed)
-        
-        return processed
+        # Already XML-escaped by _basic_render
+        return self.inline_formatter.format(text)
+
+class ThemedRenderer(ImprovedRenderer):
+    """Base of the styled renderers, whose fallback rendering covers h1/h2,
+    quotes and code blocks using the (opening, closing) markup in `theme`"""
+    theme = {}
+
+    @property
+    def code_block_opening(self):
+        return self.theme['code']
+
+    def _render_line(self, line, stripped_line):
+        if stripped_line.startswith('# '):
+            opening, closing = self.theme['h1']
+            text = stripped_line[2:]
+        elif stripped_line.startswith('## '):
+            opening, closing = self.theme['h2']
+            text = stripped_line[3:]
+        elif stripped_line.startswith('&gt; '):
+            opening, closing = self.theme['quote']
+            text = stripped_line[5:]
+        else:
+            return self._process_inline_format(stripped_line)
+        processed = self._process_inline_format(text)
+        return f'{opening}{processed}{closing}'
+
+class GitHubRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="bold" foreground="#1f2328">', '</span>'),
+        'italic': ('<span style="italic" foreground="#656d76">', '</span>'),
+        'code': ('<span font_family="SFMono-Regular" background="#f6f8fa" foreground="#d1242f" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#0969da" underline="single">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="SFMono-Regular,Consolas" background="#f6f8fa" foreground="#24292f">',
+        'h1': ('<span size="28000" weight="bold" foreground="#1f2328">', '</span>\n<span foreground="#d1d9e0">' + WIDE_RULE + '</span>'),
+        'h2': ('<span size="24000" weight="bold" foreground="#1f2328">', '</span>'),
+        'quote': ('<span style="italic" foreground="#656d76" background="#f6f8fa">▎ ', '</span>'),
+    }
 
-class GitHubRenderer(ImprovedRenderer):
     def __init__(self):
         super().__init__()
         self.style = "github"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="SFMono-Regular,Consolas" background="#f6f8fa" foreground="#24292f">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_github(stripped_line[2:])
-                result.append(f'<span size="28000" weight="bold" foreground="#1f2328">{processed}</span>')
-                result.append('<span foreground="#d1d9e0">' + '─' * 60 + '</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_github(stripped_line[3:])
-                result.append(f'<span size="24000" weight="bold" foreground="#1f2328">{processed}</span>')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_github(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#656d76" background="#f6f8fa">▎ {processed}</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_github(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_github(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="bold" foreground="#1f2328">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#656d76">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="SFMono-Regular" background="#f6f8fa" foreground="#d1242f" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#0969da" underline="single">\1</span>', processed)
-        return processed
-
-class GitHubLightRenderer(ImprovedRenderer):
+class GitHubLightRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="600" foreground="#1f2328">', '</span>'),
+        'italic': ('<span style="italic" foreground="#636c76">', '</span>'),
+        'code': ('<span font_family="SFMono-Regular" background="#afb8c133" foreground="#d1242f" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#0969da" underline="single">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="SFMono-Regular,Consolas" background="#f6f8fa" foreground="#24292f">',
+        'h1': ('<span size="32000" weight="600" foreground="#1f2328">', '</span>\n<span foreground="#d1d9e0">' + WIDE_RULE + '</span>'),
+        'h2': ('<span size="26000" weight="600" foreground="#1f2328">', '</span>'),
+        'quote': ('<span style="italic" foreground="#636c76" background="#f6f8fa">▎ ', '</span>'),
+    }
+
     def __init__(self):
         super().__init__()
         self.style = "github-light"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="SFMono-Regular,Consolas" background="#f6f8fa" foreground="#24292f">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_github_light(stripped_line[2:])
-                result.append(f'<span size="32000" weight="600" foreground="#1f2328">{processed}</span>')
-                result.append('<span foreground="#d1d9e0">' + '─' * 60 + '</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_github_light(stripped_line[3:])
-                result.append(f'<span size="26000" weight="600" foreground="#1f2328">{processed}</span>')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_github_light(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#636c76" background="#f6f8fa">▎ {processed}</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_github_light(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_github_light(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="600" foreground="#1f2328">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#636c76">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="SFMono-Regular" background="#afb8c133" foreground="#d1242f" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#0969da" underline="single">\1</span>', processed)
-        return processed
-
-class GitHubDarkRenderer(ImprovedRenderer):
+class GitHubDarkRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="600" foreground="#f0f6fc">', '</span>'),
+        'italic': ('<span style="italic" foreground="#8b949e">', '</span>'),
+        'code': ('<span font_family="SFMono-Regular" background="#6e768166" foreground="#ff7b72" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#58a6ff" underline="single">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="SFMono-Regular,Consolas" background="#161b22" foreground="#e6edf3">',
+        'h1': ('<span size="32000" weight="600" foreground="#f0f6fc">', '</span>\n<span foreground="#30363d">' + WIDE_RULE + '</span>'),
+        'h2': ('<span size="26000" weight="600" foreground="#f0f6fc">', '</span>'),
+        'quote': ('<span style="italic" foreground="#8b949e" background="#161b22">▎ ', '</span>'),
+    }
+
     def __init__(self):
         super().__init__()
         self.style = "github-dark"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="SFMono-Regular,Consolas" background="#161b22" foreground="#e6edf3">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_github_dark(stripped_line[2:])
-                result.append(f'<span size="32000" weight="600" foreground="#f0f6fc">{processed}</span>')
-                result.append('<span foreground="#30363d">' + '─' * 60 + '</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_github_dark(stripped_line[3:])
-                result.append(f'<span size="26000" weight="600" foreground="#f0f6fc">{processed}</span>')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_github_dark(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#8b949e" background="#161b22">▎ {processed}</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_github_dark(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_github_dark(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="600" foreground="#f0f6fc">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#8b949e">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="SFMono-Regular" background="#6e768166" foreground="#ff7b72" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#58a6ff" underline="single">\1</span>', processed)
-        return processed
-
-class GitLabRenderer(ImprovedRenderer):
+class GitLabRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="bold" foreground="#303030">', '</span>'),
+        'italic': ('<span style="italic" foreground="#525252">', '</span>'),
+        'code': ('<span font_family="JetBrains Mono" background="#fdf2f2" foreground="#c73e1d" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#1f75cb" underline="single" weight="medium">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="JetBrains Mono,Consolas" background="#fbfafd" foreground="#303030">',
+        'h1': ('<span size="28000" weight="bold" foreground="#303030">', '</span>\n<span foreground="#6b4fbb">' + WIDE_RULE + '</span>'),
+        'h2': ('<span size="24000" weight="bold" foreground="#303030">', '</span>'),
+        'quote': ('<span style="italic" foreground="#6b4fbb" background="#fbfafd">▎ ', '</span>'),
+    }
+
     def __init__(self):
         super().__init__()
         self.style = "gitlab"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="JetBrains Mono,Consolas" background="#fbfafd" foreground="#303030">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_gitlab(stripped_line[2:])
-                result.append(f'<span size="28000" weight="bold" foreground="#303030">{processed}</span>')
-                result.append('<span foreground="#6b4fbb">' + '─' * 60 + '</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_gitlab(stripped_line[3:])
-                result.append(f'<span size="24000" weight="bold" foreground="#303030">{processed}</span>')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_gitlab(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#6b4fbb" background="#fbfafd">▎ {processed}</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_gitlab(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_gitlab(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="bold" foreground="#303030">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#525252">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="JetBrains Mono" background="#fdf2f2" foreground="#c73e1d" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#1f75cb" underline="single" weight="medium">\1</span>', processed)
-        return processed
-
-class SplendorRenderer(ImprovedRenderer):
+class SplendorRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="600" foreground="#2c3e50">', '</span>'),
+        'italic': ('<span style="italic" foreground="#7f8c8d">', '</span>'),
+        'code': ('<span font_family="Consolas" background="#ecf0f1" foreground="#e74c3c" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#3498db" underline="single">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="Consolas,Monaco" background="#fafafa" foreground="#333">',
+        'h1': ('<span size="36000" weight="300" foreground="#2c3e50">', '</span>\n<span foreground="#bdc3c7">' + DASHED_RULE + '</span>'),
+        'h2': ('<span size="28000" weight="400" foreground="#34495e">', '</span>'),
+        'quote': ('<span style="italic" foreground="#7f8c8d" background="#ecf0f1">" ', ' "</span>'),
+    }
+
     def __init__(self):
         super().__init__()
         self.style = "splendor"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="Consolas,Monaco" background="#fafafa" foreground="#333">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_splendor(stripped_line[2:])
-                result.append(f'<span size="36000" weight="300" foreground="#2c3e50">{processed}</span>')
-                result.append('<span foreground="#bdc3c7">' + '╌' * 50 + '</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_splendor(stripped_line[3:])
-                result.append(f'<span size="28000" weight="400" foreground="#34495e">{processed}</span>')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_splendor(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#7f8c8d" background="#ecf0f1">" {processed} "</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_splendor(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_splendor(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="600" foreground="#2c3e50">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#7f8c8d">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="Consolas" background="#ecf0f1" foreground="#e74c3c" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#3498db" underline="single">\1</span>', processed)
-        return processed
-
-class ModestRenderer(ImprovedRenderer):
+class ModestRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="bold" foreground="#333">', '</span>'),
+        'italic': ('<span style="italic" foreground="#666">', '</span>'),
+        'code': ('<span font_family="Menlo" background="#f5f5f5" foreground="#d14" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#337ab7" underline="single">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="Menlo,Monaco" background="#f5f5f5" foreground="#333">',
+        'h1': ('<span size="28000" weight="bold" foreground="#333">', '</span>'),
+        'h2': ('<span size="24000" weight="bold" foreground="#444">', '</span>'),
+        'quote': ('<span style="italic" foreground="#777" background="#f9f9f9">│ ', '</span>'),
+    }
+
     def __init__(self):
         super().__init__()
         self.style = "modest"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="Menlo,Monaco" background="#f5f5f5" foreground="#333">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_modest(stripped_line[2:])
-                result.append(f'<span size="28000" weight="bold" foreground="#333">{processed}</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_modest(stripped_line[3:])
-                result.append(f'<span size="24000" weight="bold" foreground="#444">{processed}</span>')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_modest(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#777" background="#f9f9f9">│ {processed}</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_modest(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_modest(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="bold" foreground="#333">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#666">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="Menlo" background="#f5f5f5" foreground="#d14" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#337ab7" underline="single">\1</span>', processed)
-        return processed
-
-class RetroRenderer(ImprovedRenderer):
+class RetroRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="bold" foreground="#8b4513">', '</span>'),
+        'italic': ('<span style="italic" foreground="#8b7355">', '</span>'),
+        'code': ('<span font_family="Courier New" background="#eee8d5" foreground="#b58900" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#268bd2" underline="single">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="Courier New,monospace" background="#eee8d5" foreground="#657b83">',
+        'h1': ('<span size="30000" weight="bold" foreground="#8b4513">', '</span>\n<span foreground="#cd853f">' + DASHED_RULE + '</span>'),
+        'h2': ('<span size="26000" weight="bold" foreground="#a0522d">', '</span>'),
+        'quote': ('<span style="italic" foreground="#8b7355" background="#f5f5dc">▌ ', '</span>'),
+    }
+
     def __init__(self):
         super().__init__()
         self.style = "retro"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="Courier New,monospace" background="#eee8d5" foreground="#657b83">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_retro(stripped_line[2:])
-                result.append(f'<span size="30000" weight="bold" foreground="#8b4513">{processed}</span>')
-                result.append('<span foreground="#cd853f">' + '╌' * 50 + '</span>')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_retro(stripped_line[3:])
-                result.append(f'<span size="26000" weight="bold" foreground="#a0522d">{processed}</span>')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_retro(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#8b7355" background="#f5f5dc">▌ {processed}</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_retro(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_retro(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="bold" foreground="#8b4513">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#8b7355">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="Courier New" background="#eee8d5" foreground="#b58900" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#268bd2" underline="single">\1</span>', processed)
-        return processed
-
-class AirRenderer(ImprovedRenderer):
+class AirRenderer(ThemedRenderer):
+    inline_formatter = InlineFormatter({
+        'bold': ('<span weight="600" foreground="#2aa198">', '</span>'),
+        'italic': ('<span style="italic" foreground="#586e75">', '</span>'),
+        'code': ('<span font_family="Source Code Pro" background="#eee8d5" foreground="#cb4b16" size="small"> ', ' </span>'),
+        'link': ('<span foreground="#268bd2" underline="single">', '</span>'),
+    })
+
+    theme = {
+        'code': '<span font_family="Source Code Pro,monospace" background="#fafafa" foreground="#586e75">',
+        'h1': ('<span size="32000" weight="300" foreground="#2aa198">', '</span>\n'),
+        'h2': ('<span size="26000" weight="400" foreground="#268bd2">', '</span>\n'),
+        'quote': ('<span style="italic" foreground="#93a1a1" background="#fdf6e3">  ', '</span>'),
+    }
+
     def __init__(self):
         super().__init__()
         self.style = "air"
 
-    def _basic_render(self, text):
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            stripped_line = line.strip()
-            
-            if stripped_line.startswith('```'):
-                in_code_block = not in_code_block
-                if in_code_block:
-                    result.append('<span font_family="Source Code Pro,monospace" background="#fafafa" foreground="#586e75">')
-                else:
-                    result.append('</span>')
-                continue
-            
-            if in_code_block:
-                escaped = stripped_line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                result.append(escaped)
-                continue
-            
-            if stripped_line.startswith('# '):
-                processed = self._process_inline_format_air(stripped_line[2:])
-                result.append(f'<span size="32000" weight="300" foreground="#2aa198">{processed}</span>')
-                result.append('')
-            elif stripped_line.startswith('## '):
-                processed = self._process_inline_format_air(stripped_line[3:])
-                result.append(f'<span size="26000" weight="400" foreground="#268bd2">{processed}</span>')
-                result.append('')
-            elif stripped_line.startswith('> '):
-                processed = self._process_inline_format_air(stripped_line[2:])
-                result.append(f'<span style="italic" foreground="#93a1a1" background="#fdf6e3">  {processed}</span>')
-            else:
-                if stripped_line:
-                    processed = self._process_inline_format_air(stripped_line)
-                    result.append(processed)
-                else:
-                    result.append('')
-        
-        if in_code_block:
-            result.append('</span>')
-        
-        return '\n'.join(result)
-    
-    def _process_inline_format_air(self, text):
-        if not text:
-            return text
-        processed = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        processed = re.sub(r'\*\*([^*\n]+?)\*\*', r'<span weight="600" foreground="#2aa198">\1</span>', processed)
-        processed = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<span style="italic" foreground="#586e75">\1</span>', processed)
-        processed = re.sub(r'`([^`\n]+?)`', r'<span font_family="Source Code Pro" background="#eee8d5" foreground="#cb4b16" size="small"> \1 </span>', processed)
-        processed = re.sub(r'\[([^\]]+?)\]\(([^)]+?)\)', r'<span foreground="#268bd2" underline="single">\1</span>', processed)
-        return processed
-
 class ScrollSyncMixin:
     def setup_scroll_sync(self):
         if not hasattr(self, 'editor_scroll') or not hasattr(self, 'preview_scroll'):
@@ -1122,6 +1203,7 @@ class ScrollSyncMixin:
             
         self.sync_scroll_enabled = True
         self.click_in_progress = False
+        self.scroll_sync_id = None
         
         self.editor_vadj = self.editor_scroll.get_vadjustment()
         self.preview_vadj = self.preview_scroll.get_vadjustment()
@@ -1142,36 +1224,38 @@ class ScrollSyncMixin:
         return False
 
     def on_editor_scroll(self, adjustment):
-        if not self.sync_scroll_enabled or self.click_in_progress:
-            return
-            
-        if adjustment.get_upper() - adjustment.get_page_size() > 0:
-            ratio = adjustment.get_value() / (adjustment.get_upper() - adjustment.get_page_size())
-            
-            self.sync_scroll_enabled = False
-            try:
-                preview_max = self.preview_vadj.get_upper() - self.preview_vadj.get_page_size()
-                if preview_max > 0:
-                    new_value = ratio * preview_max
-                    self.preview_vadj.set_value(new_value)
-            finally:
-                self.sync_scroll_enabled = True
+        self.schedule_scroll_sync(adjustment, self.preview_vadj)
 
     def on_preview_scroll(self, adjustment):
+        self.schedule_scroll_sync(adjustment, self.editor_vadj)
+
+    def schedule_scroll_sync(self, source, target):
         if not self.sync_scroll_enabled or self.click_in_progress:
             return
-            
-        if adjustment.get_upper() - adjustment.get_page_size() > 0:
-            ratio = adjustment.get_value() / (adjustment.get_upper() - adjustment.get_page_size())
+        # value-changed fires on every scroll step; sync once per main loop
+        # iteration, before the next frame is drawn, from the latest position
+        self.scroll_sync_adjustments = (source, target)
+        if not self.scroll_sync_id:
+            self.scroll_sync_id = GLib.idle_add(self.on_scroll_sync_idle, priority=GLib.PRIORITY_HIGH_IDLE)
+
+    def on_scroll_sync_idle(self):
+        self.scroll_sync_id = None
+        if not self.sync_scroll_enabled or self.click_in_progress:
+            return False
+        
+        source, target = self.scroll_sync_adjustments
+        source_max = source.get_upper() - source.get_page_size()
+        if source_max > 0:
+            ratio = source.get_value() / source_max
             
             self.sync_scroll_enabled = False
             try:
-                editor_max = self.editor_vadj.get_upper() - self.editor_vadj.get_page_size()
-                if editor_max > 0:
-                    new_value = ratio * editor_max
-                    self.editor_vadj.set_value(new_value)
+                target_max = target.get_upper() - target.get_page_size()
+                if target_max > 0:
+                    target.set_value(ratio * target_max)
             finally:
                 self.sync_scroll_enabled = True
+        return False
     
     def disable_scroll_sync(self):
         self.sync_scroll_enabled = False
@@ -1180,6 +1264,9 @@ class ScrollSyncMixin:
         self.sync_scroll_enabled = True
 
 class SearchMixin:
+    # (text, term) -> start offsets; a multi-term matcher can replace it
+    match_finder = staticmethod(find_match_starts)
+
     def create_search_bar(self):
         if not Gtk:
             return None
@@ -1233,7 +1320,8 @@ class SearchMixin:
         if not hasattr(self, 'text_buffer') or not Pango:
             return
             
-        self.search_matches = []
+        self.search_match_starts = array('i')
+        self.search_match_length = 0
         self.current_search_index = -1
         
         self.search_tag = self.text_buffer.create_tag("search_highlight")
@@ -1244,6 +1332,10 @@ class SearchMixin:
         self.current_search_tag.set_property("background", "#ff6600")
         self.current_search_tag.set_property("weight", Pango.Weight.BOLD)
 
+        self.search_highlight_id = None
+        if hasattr(self, 'editor_scroll'):
+            self.editor_scroll.get_vadjustment().connect("value-changed", self.on_search_view_scrolled)
+
     def toggle_search(self):
         if not hasattr(self, 'search_bar'):
             return
@@ -1268,58 +1360,79 @@ class SearchMixin:
         else:
             self.clear_search_highlights()
     
-    def search_in_text(self, search_text):
+    def search_in_text(self, search_text, buffer_text=None):
+        # The same text in an unchanged buffer is already highlighted
+        search_key = (getattr(self, 'buffer_version', 0), search_text)
+        if search_key == getattr(self, 'search_key', None):
+            return
+        
         self.clear_search_highlights()
         
         if not search_text or not hasattr(self, 'text_buffer'):
             return
-            
-        buffer_text = self.text_buffer.get_text(
-            self.text_buffer.get_start_iter(),
-            self.text_buffer.get_end_iter(),
-            False
-        )
+        self.search_key = search_key
         
-        self.search_matches = []
-        start = 0
-        while True:
-            pos = buffer_text.lower().find(search_text.lower(), start)
-            if pos == -1:
-                break
-            self.search_matches.append((pos, pos + len(search_text)))
-            start = pos + 1
+        if buffer_text is None:
+            buffer_text = self.get_document_text()
         
-        for start_pos, end_pos in self.search_matches:
-            start_iter = self.text_buffer.get_start_iter()
-            start_iter.forward_chars(start_pos)
-            end_iter = self.text_buffer.get_start_iter()
-            end_iter.forward_chars(end_pos)
-            self.text_buffer.apply_tag(self.search_tag, start_iter, end_iter)
+        self.search_match_length = len(search_text)
+        self.search_match_starts = self.match_finder(buffer_text, search_text)
+        
+        self.highlight_visible_matches()
         
-        if self.search_matches:
+        if self.search_match_starts:
             self.current_search_index = 0
             self.highlight_current_match()
             if hasattr(self, 'search_results_label'):
-                self.search_results_label.set_text(f"{len(self.search_matches)} {_('matches')}")
+                self.search_results_label.set_text(f"{len(self.search_match_starts)} {_('matches')}")
         else:
             self.current_search_index = -1
             if hasattr(self, 'search_results_label'):
                 self.search_results_label.set_text(_("No matches"))
     
+    def highlight_visible_matches(self):
+        # Only matches around the visible text are tagged, so a short term
+        # matching all over a long document costs no more than a screenful
+        if not self.search_match_starts or not hasattr(self, 'text_view'):
+            return
+        
+        self.text_buffer.remove_tag(self.search_tag, self.text_buffer.get_start_iter(),
+                                    self.text_buffer.get_end_iter())
+        
+        rect = self.text_view.get_visible_rect()
+        first_iter = self.text_view.get_iter_at_location(rect.x, rect.y)[1]
+        last_iter = self.text_view.get_iter_at_location(rect.x + rect.width, rect.y + rect.height)[1]
+        low = bisect_left(self.search_match_starts, first_iter.get_offset() - SEARCH_HIGHLIGHT_MARGIN)
+        high = bisect_right(self.search_match_starts, last_iter.get_offset() + SEARCH_HIGHLIGHT_MARGIN)
+        
+        # get_iter_at_offset looks the offset up in the buffer's btree
+        # instead of walking every character from the start
+        for start_pos in self.search_match_starts[low:high]:
+            start_iter = self.text_buffer.get_iter_at_offset(start_pos)
+            end_iter = self.text_buffer.get_iter_at_offset(start_pos + self.search_match_length)
+            self.text_buffer.apply_tag(self.search_tag, start_iter, end_iter)
+
+    def on_search_view_scrolled(self, adjustment):
+        if self.search_match_starts and not self.search_highlight_id:
+            self.search_highlight_id = GLib.idle_add(self.on_search_highlight_idle, priority=GLib.PRIORITY_HIGH_IDLE)
+
+    def on_search_highlight_idle(self):
+        self.search_highlight_id = None
+        self.highlight_visible_matches()
+        return False
+
     def highlight_current_match(self):
         if (self.current_search_index >= 0 and 
-            self.current_search_index < len(self.search_matches) and
+            self.current_search_index < len(self.search_match_starts) and
             hasattr(self, 'text_buffer')):
             
             start_iter = self.text_buffer.get_start_iter()
             end_iter = self.text_buffer.get_end_iter()
             self.text_buffer.remove_tag(self.current_search_tag, start_iter, end_iter)
             
-            start_pos, end_pos = self.search_matches[self.current_search_index]
-            start_iter = self.text_buffer.get_start_iter()
-            start_iter.forward_chars(start_pos)
-            end_iter = self.text_buffer.get_start_iter()
-            end_iter.forward_chars(end_pos)
+            start_pos = self.search_match_starts[self.current_search_index]
+            start_iter = self.text_buffer.get_iter_at_offset(start_pos)
+            end_iter = self.text_buffer.get_iter_at_offset(start_pos + self.search_match_length)
             
             self.text_buffer.apply_tag(self.current_search_tag, start_iter, end_iter)
             
@@ -1327,16 +1440,16 @@ class SearchMixin:
                 self.text_view.scroll_to_iter(start_iter, 0.1, False, 0.0, 0.0)
             
             if hasattr(self, 'search_results_label'):
-                self.search_results_label.set_text(f"{self.current_search_index + 1} {_('of')} {len(self.search_matches)}")
+                self.search_results_label.set_text(f"{self.current_search_index + 1} {_('of')} {len(self.search_match_starts)}")
     
     def on_search_next(self, button):
-        if self.search_matches:
-            self.current_search_index = (self.current_search_index + 1) % len(self.search_matches)
+        if self.search_match_starts:
+            self.current_search_index = (self.current_search_index + 1) % len(self.search_match_starts)
             self.highlight_current_match()
     
     def on_search_previous(self, button):
-        if self.search_matches:
-            self.current_search_index = (self.current_search_index - 1) % len(self.search_matches)
+        if self.search_match_starts:
+            self.current_search_index = (self.current_search_index - 1) % len(self.search_match_starts)
             self.highlight_current_match()
     
     def clear_search_highlights(self):
@@ -1351,16 +1464,32 @@ class SearchMixin:
         if hasattr(self, 'current_search_tag'):
             self.text_buffer.remove_tag(self.current_search_tag, start_iter, end_iter)
             
-        self.search_matches = []
+        self.search_match_starts = array('i')
+        self.search_match_length = 0
         self.current_search_index = -1
+        self.search_key = None
         
         if hasattr(self, 'search_results_label'):
             self.search_results_label.set_text("")
     
-    def update_search_if_active(self):
-        if (hasattr(self, 'search_bar') and hasattr(self, 'search_entry') and
-            self.search_bar.get_search_mode() and self.search_entry.get_text()):
-            self.search_in_text(self.search_entry.get_text())
+    def is_search_active(self):
+        return (hasattr(self, 'search_bar') and hasattr(self, 'search_entry') and
+                self.search_bar.get_search_mode() and bool(self.search_entry.get_text()))
+
+    def update_search_if_active(self, buffer_text=None):
+        if not self.is_search_active():
+            return
+        # Editing restarts the timer, so the document is searched again once
+        # per pause instead of on every keystroke
+        if getattr(self, 'search_update_id', None):
+            GLib.source_remove(self.search_update_id)
+        self.search_update_id = GLib.timeout_add(SEARCH_UPDATE_DELAY_MS, self.on_search_update_timeout, buffer_text)
+
+    def on_search_update_timeout(self, buffer_text):
+        self.search_update_id = None
+        if self.is_search_active():
+            self.search_in_text(self.search_entry.get_text(), buffer_text)
+        return False
 
 class FileOperationsMixin:
     def on_open(self, widget):
@@ -1438,7 +1567,6 @@ class FileOperationsMixin:
             if file:
                 self.current_file = file.get_path()
                 self.save_file()
-                self.update_title()
                 self.update_header()
         dialog.destroy()
     
@@ -1448,7 +1576,13 @@ class FileOperationsMixin:
                 content = f.read()
             
             if hasattr(self, 'text_buffer'):
-                self.text_buffer.set_text(content)
+                # Opening a file is not an edit to undo; outside the undo
+                # history the whole document is not kept there a second time
+                self.text_buffer.begin_irreversible_action()
+                try:
+                    self.text_buffer.set_text(content)
+                finally:
+                    self.text_buffer.end_irreversible_action()
                 
             self.current_file = file_path
             self.document_modified = False
@@ -1456,8 +1590,7 @@ class FileOperationsMixin:
             if hasattr(self, 'save_btn'):
                 self.save_btn.set_sensitive(False)
             
-            filename = os.path.basename(file_path)
-            self.set_title(f"{filename} - {_('Markdown Editor')}")
+            self.update_title()
             
             if hasattr(self, 'doc_status_label'):
                 self.doc_status_label.set_text(_("Ready"))
@@ -1483,24 +1616,21 @@ class FileOperationsMixin:
             
         try:
             if hasattr(self, 'text_buffer'):
-                text = self.text_buffer.get_text(
-                    self.text_buffer.get_start_iter(),
-                    self.text_buffer.get_end_iter(),
-                    False
-                )
+                text = self.get_document_text()
             else:
                 text = ""
                 
-            with open(self.current_file, "w", encoding="utf-8") as f:
-                f.write(text)
+            # Encoded once and replaced in one step, so a crash mid-save
+            # never leaves the document truncated. Through symlinks
+            target = os.path.realpath(self.current_file)
+            write_file_atomic(target, text.encode("utf-8"), sync=True)
             
             self.document_modified = False
             
             if hasattr(self, 'save_btn'):
                 self.save_btn.set_sensitive(False)
                 
-            filename = os.path.basename(self.current_file)
-            self.set_title(f"{filename} - {_('Markdown Editor')}")
+            self.update_title()
             
             if hasattr(self, 'doc_status_label'):
                 self.doc_status_label.set_text(_("Saved"))
@@ -1520,11 +1650,12 @@ class FileOperationsMixin:
         dialog.present()
     
     def update_title(self):
+        # Only called when the file or the language changes, never per edit
         if self.current_file:
-            filename = os.path.basename(self.current_file)
-            self.set_title(f"{filename} - {_('Markdown Editor')}")
+            document_name = os.path.basename(self.current_file)
         else:
-            self.set_title(f"{_('New document')} - {_('Markdown Editor')}")
+            document_name = _('New document')
+        self.set_title(f"{document_name} - {_('Markdown Editor')}")
 
     def update_header(self):
         pass
@@ -1539,7 +1670,7 @@ class FileOperationsMixin:
         if hasattr(self, 'text_buffer'):
             self.text_buffer.set_text("")
         
-        self.set_title(f"{_('New document')} - {_('Markdown Editor')}")
+        self.update_title()
         
         if hasattr(self, 'show_editor_state'):
             self.show_editor_state()
@@ -1568,7 +1699,7 @@ class FileOperationsMixin:
                 if hasattr(self, 'save_btn'):
                     self.save_btn.set_sensitive(False)
                     
-                self.set_title(f"{_('New document')} - {_('Markdown Editor')}")
+                self.update_title()
                 
                 if hasattr(self, 'clear_search_highlights'):
                     self.clear_search_highlights()
@@ -1579,6 +1710,9 @@ class FileOperationsMixin:
             print(f"Error creating new document: {e}")
 
 class EditorActionsMixin:
+    # Shared by every window, as the renderers are (RendererFactory)
+    preview_executor = None
+
     def setup_editor_events(self):
         if not hasattr(self, 'text_view') or not Gtk:
             return
@@ -1690,33 +1824,24 @@ class EditorActionsMixin:
             
             current_line = self.text_buffer.get_text(line_start, line_end, False)
             
-            list_patterns = [
-                (r'^(\s*)-\s+(.*)$', r'\1- '),
-                (r'^(\s*)\*\s+(.*)$', r'\1* '),
-                (r'^(\s*)\+\s+(.*)$', r'\1+ '),
-                (r'^(\s*)(\d+)\.\s+(.*)$', r'\1{}. '),
-                (r'^(\s*)-\s+\[\s*\]\s+(.*)$', r'\1- [ ] '),
-                (r'^(\s*)-\s+\[x\]\s+(.*)$', r'\1- [ ] '),
-            ]
-            
-            for pattern, replacement in list_patterns:
-                match = re.match(pattern, current_line)
+            for pattern, marker in LIST_CONTINUATIONS:
+                match = pattern.match(current_line)
                 if match:
-                    if len(match.groups()) >= 2 and not match.group(-1).strip():
+                    # Enter on an empty item ends the list
+                    if not match.groups()[-1].strip():
                         self.text_buffer.delete(line_start, iter_at_cursor)
                         self.in_list_context = False
                         return False
                     
-                    if '{}' in replacement:
+                    if '{}' in marker:
                         try:
                             next_num = int(match.group(2)) + 1
-                            new_prefix = replacement.format(next_num)
+                            marker = marker.format(next_num)
                         except (ValueError, IndexError):
-                            new_prefix = replacement.replace('{}', '1')
-                    else:
-                        new_prefix = replacement
+                            marker = marker.replace('{}', '1')
                     
-                    self.text_buffer.insert_at_cursor(f"\n{new_prefix}")
+                    # The new item keeps the indent of the current one
+                    self.text_buffer.insert_at_cursor(f"\n{match.group(1)}{marker}")
                     return True
             
             self.in_list_context = False
@@ -1740,19 +1865,68 @@ class EditorActionsMixin:
         except Exception as e:
             print(f"Error updating cursor position: {e}")
     
+    # The document's UTF-8 size and word count follow each edit, so the
+    # status bar does not walk the whole buffer on every keystroke. Both
+    # handlers run before the buffer changes. buffer_version counts the
+    # edits themselves, telling on_text_changed and searches apart from
+    # earlier text
+    def on_buffer_insert_text(self, buffer, location, text, length):
+        # GTK passes the inserted length in bytes
+        self.document_bytes += length
+        self.word_count += self.word_count_delta(buffer, location, location, text)
+        self.buffer_version += 1
+
+    def on_buffer_delete_range(self, buffer, start, end):
+        deleted = buffer.get_text(start, end, True)
+        self.document_bytes -= len(deleted.encode('utf-8'))
+        self.word_count -= self.word_count_delta(buffer, start, end, deleted)
+        self.buffer_version += 1
+
+    def get_document_text(self):
+        # Copied out of the buffer once per edit, however many readers ask
+        if getattr(self, 'document_text_version', None) != self.buffer_version:
+            self.document_text = self.text_buffer.get_text(
+                self.text_buffer.get_start_iter(),
+                self.text_buffer.get_end_iter(),
+                False
+            )
+            self.document_text_version = self.buffer_version
+        return self.document_text
+
+    def word_count_delta(self, buffer, start, end, text):
+        # Words can only join or split at the characters next to the edit,
+        # so those two are all the context text needs to be counted in
+        before = start.copy()
+        before.backward_char()
+        after = end.copy()
+        after.forward_char()
+        left = buffer.get_text(before, start, True)
+        right = buffer.get_text(end, after, True)
+        return len((left + text + right).split()) - len((left + right).split())
+
     def update_detailed_stats(self, text):
-        if not text:
-            text = ""
-            
+        self.update_cursor_position()
+        # Lines, words and size go to the status bar together once typing
+        # pauses, one relabel per burst
+        if getattr(self, 'stats_update_id', None):
+            GLib.source_remove(self.stats_update_id)
+        self.stats_update_id = GLib.timeout_add(PREVIEW_UPDATE_DELAY_MS, self.on_stats_timeout, text or "")
+
+    def on_stats_timeout(self, text):
+        self.stats_update_id = None
         try:
-            lines = text.split('\n')
-            words = len([word for word in text.split() if word.strip()])
-            size_bytes = len(text.encode('utf-8'))
-            
-            if hasattr(self, 'lines_label'):
-                self.lines_label.set_text(f"{len(lines)} {_('lines')}")
-            if hasattr(self, 'words_label'):
-                self.words_label.set_text(f"{words} {_('words')}")
+            # The buffer keeps its line count, no need to split the text
+            if hasattr(self, 'text_buffer'):
+                line_count = self.text_buffer.get_line_count()
+                word_count = self.word_count
+            else:
+                line_count = text.count('\n') + 1
+                word_count = len(text.split())
+            size_bytes = getattr(self, 'document_bytes', 0)
+            stats = (line_count, word_count, size_bytes)
+            if stats == getattr(self, 'shown_stats', None):
+                return False
+            self.shown_stats = stats
             
             if size_bytes < 1024:
                 size_text = f"{size_bytes} B"
@@ -1761,45 +1935,34 @@ class EditorActionsMixin:
             else:
                 size_text = f"{size_bytes / (1024 * 1024):.1f} MB"
             
+            if hasattr(self, 'lines_label'):
+                self.lines_label.set_text(f"{line_count} {_('lines')}")
+            if hasattr(self, 'words_label'):
+                self.words_label.set_text(f"{word_count} {_('words')}")
             if hasattr(self, 'size_label'):
                 self.size_label.set_text(size_text)
-                
-            self.update_cursor_position()
             
         except Exception as e:
             print(f"Error updating statistics: {e}")
-
-    def update_cursor_position(self):
-        if not hasattr(self, 'text_buffer') or not hasattr(self, 'cursor_label'):
-            return
-            
-        try:
-            mark = self.text_buffer.get_insert()
-            iter_at_mark = self.text_buffer.get_iter_at_mark(mark)
-            line = iter_at_mark.get_line() + 1
-            col = iter_at_mark.get_line_offset() + 1
-            self.cursor_label.set_text(f"{_('Line')} {line}, {_('Col')} {col}")
-        except Exception as e:
-            print(f"Error updating cursor position: {e}")
+        return False
 
     def on_text_changed(self, buffer):
         try:
+            # "changed" without an insert or delete in between leaves the
+            # text as it was; nothing to copy out of the buffer or redo
+            if self.buffer_version == getattr(self, 'changed_version', None):
+                return
+            self.changed_version = self.buffer_version
+            
             self.document_modified = True
             
             if hasattr(self, 'save_btn'):
                 self.save_btn.set_sensitive(True)
             
-            text = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False)
+            text = self.get_document_text()
             
-            if hasattr(self, 'renderer') and hasattr(self, 'preview_label'):
-                preview_text = self.renderer.render_text(text)
-                
-                try:
-                    self.preview_label.set_text("")
-                    self.preview_label.set_markup(preview_text)
-                except Exception as e:
-                    print(f"Error in set_markup: {e}")
-                    self.preview_label.set_text(text)
+            if hasattr(self, 'renderer') and hasattr(self, 'preview_view'):
+                self.schedule_preview_update(text)
             
             self.update_detailed_stats(text)
             
@@ -1807,11 +1970,124 @@ class EditorActionsMixin:
                 self.doc_status_label.set_text(_("Modified"))
             
             if hasattr(self, 'update_search_if_active'):
-                self.update_search_if_active()
+                self.update_search_if_active(text)
             
         except Exception as e:
             print(f"Error in on_text_changed: {e}")
     
+    def schedule_preview_update(self, text):
+        # Typing restarts the timer, so the preview is rendered once per pause.
+        # Every edit schedules again with its own text, so the text read in
+        # on_text_changed is still the buffer's when the timer fires
+        if getattr(self, 'preview_update_id', None):
+            GLib.source_remove(self.preview_update_id)
+        self.preview_update_id = GLib.timeout_add(PREVIEW_UPDATE_DELAY_MS, self.on_preview_update_timeout, text)
+
+    def on_preview_update_timeout(self, text):
+        self.preview_update_id = None
+        # Change signals that leave the text as it was (retyping a
+        # selection, undoing back) need neither a render nor a relayout
+        if text != getattr(self, 'preview_source_text', None):
+            self.request_preview(text)
+        return False
+
+    def request_preview(self, text):
+        # Rendered on a worker thread so typing never waits for the markdown
+        # parser. A single worker, for all windows, runs the renders in
+        # order and is the only thread that touches the renderers and
+        # their caches
+        if EditorActionsMixin.preview_executor is None:
+            EditorActionsMixin.preview_executor = ThreadPoolExecutor(max_workers=1)
+        previous = getattr(self, 'preview_future', None)
+        if previous is not None:
+            previous.cancel()
+        
+        self.preview_source_text = text
+        future = self.preview_executor.submit(self.renderer.render_text, text)
+        self.preview_future = future
+        future.add_done_callback(lambda done: self.on_preview_done(done, text))
+
+    def on_preview_done(self, future, text):
+        # On the worker thread. Cancelled requests, superseded or from a
+        # closed window, have nothing to show
+        if not future.cancelled():
+            GLib.idle_add(self.on_preview_rendered, future, text)
+
+    def on_preview_rendered(self, future, text):
+        # Back on the main loop; results of superseded requests, and those
+        # finishing after the window closed, are dropped
+        if future is not self.preview_future:
+            return False
+        try:
+            self.set_preview_markup(future.result())
+        except Exception:
+            self.set_preview_plain_text(text)
+        return False
+
+    def reset_preview_buffer(self):
+        # insert_markup adds an anonymous tag per span that outlives the
+        # text; a new buffer starts with an empty tag table
+        self.preview_buffer = Gtk.TextBuffer()
+        self.preview_view.set_buffer(self.preview_buffer)
+        self.preview_markup = None
+        self.preview_segments = []
+        self.preview_lengths = []
+        self.preview_tag_limit = PREVIEW_MIN_TAG_LIMIT
+
+    def set_preview_markup(self, markup):
+        # Edits that do not change the output (trailing spaces, a second
+        # blank line) leave the preview as it is
+        if markup == self.preview_markup:
+            return
+        
+        if self.preview_buffer.get_tag_table().get_size() > self.preview_tag_limit:
+            self.reset_preview_buffer()
+        
+        # Segments shared with the current preview at the start and at the
+        # end stay in the buffer; only the ones in between are replaced
+        segments = split_pango_segments(markup)
+        old_segments = self.preview_segments
+        old_lengths = self.preview_lengths
+        limit = min(len(segments), len(old_segments))
+        start = 0
+        while start < limit and segments[start] == old_segments[start]:
+            start += 1
+        end = 0
+        while end < limit - start and segments[-1 - end] == old_segments[-1 - end]:
+            end += 1
+        
+        buffer = self.preview_buffer
+        offset = sum(old_lengths[:start])
+        removed = sum(old_lengths[start:len(old_lengths) - end])
+        buffer.delete(buffer.get_iter_at_offset(offset), buffer.get_iter_at_offset(offset + removed))
+        
+        # Each segment's length in characters is measured as it goes in
+        lengths = []
+        for segment in segments[start:len(segments) - end]:
+            char_count = buffer.get_char_count()
+            position = buffer.get_iter_at_offset(offset)
+            # insert_markup only warns and inserts nothing on invalid markup,
+            # so a segment that does not parse is shown as its plain text
+            try:
+                Pango.parse_markup(segment, -1, '\0')
+            except GLib.Error:
+                buffer.insert(position, unescape(PANGO_TAG_RE.sub('', segment)), -1)
+            else:
+                buffer.insert_markup(position, segment, -1)
+            length = buffer.get_char_count() - char_count
+            lengths.append(length)
+            offset += length
+        
+        self.preview_markup = markup
+        self.preview_segments = segments
+        self.preview_lengths = old_lengths[:start] + lengths + old_lengths[len(old_lengths) - end:]
+        if not old_segments:
+            self.preview_tag_limit = max(PREVIEW_MIN_TAG_LIMIT, 2 * buffer.get_tag_table().get_size())
+
+    def set_preview_plain_text(self, text):
+        self.reset_preview_buffer()
+        self.preview_buffer.set_text(text)
+    
     def set_view_mode(self, mode):
         if not hasattr(self, 'paned'):
             return
@@ -1861,8 +2137,119 @@ class EditorActionsMixin:
         except Exception as e:
             print(f"Error changing view mode: {e}")
 
+# Window styles, loaded into one provider shared by all windows
+APP_CSS = b"""
+.welcome-card {
+    background-color: @window_bg_color;
+    border: 1px solid @borders;
+    border-radius: 12px;
+    box-shadow: 0 3px 10px rgba(0, 0, 0, 0.1);
+    margin: 20px;
+    padding: 40px;
+}
+
+.welcome-card:hover {
+    box-shadow: 0 5px 20px rgba(0, 0, 0, 0.15);
+    transition: box-shadow 200ms ease-in-out;
+}
+
+.super-compact-btn {
+    min-height: 18px;
+    min-width: 18px;
+    margin: 1px 2px;
+    border-radius: 2px;
+    transition: all 80ms ease-in-out;
+    border: none;
+    box-shadow: none;
+    padding: 1px;
+    background: transparent;
+}
+
+.super-compact-btn:hover {
+    background-color: alpha(@accent_color, 0.15);
+}
+
+.header-preview-btn {
+    padding: 0px 8px;
+    margin: 0px;
+    border-radius: 1px;
+    text-align: left;
+    min-height: 20px;
+    border: none;
+    background: transparent;
+}
+
+.header-preview-btn:hover {
+    background-color: alpha(@accent_color, 0.1);
+}
+
+.view-btn-active {
+    background-color: alpha(@accent_color, 0.2);
+    color: @accent_color;
+}
+
+.group-separator {
+    margin: 2px 2px;
+    opacity: 0.4;
+    min-width: 1px;
+    min-height: 18px;
+    background: alpha(@borders, 0.5);
+}
+
+.toolbar {
+    background: alpha(@headerbar_bg_color, 0.98);
+    border: none;
+    box-shadow: none;
+    padding: 1px 0px;
+}
+
+.dim-label {
+    opacity: 0.75;
+    font-size: 12px;
+    font-family: monospace;
+    padding: 2px 4px;
+}
+
+textview {
+    font-family: 'JetBrains Mono', 'Fira Code', 'Source Code Pro', 'Consolas', monospace;
+    font-size: 14px;
+    line-height: 1.5;
+}
+
+label, textview.preview {
+    font-family: 'DejaVu Sans', 'Noto Sans', sans-serif;
+    font-size: 14px;
+    line-height: 1.6;
+}
+
+textview.preview > text {
+    background: transparent;
+}
+
+separator {
+    border: none;
+    background: alpha(@borders, 0.3);
+    min-width: 1px;
+    min-height: 1px;
+}
+
+.compact-entry {
+    min-height: 24px;
+    max-height: 24px;
+    padding: 2px 8px;
+    margin: 0px;
+    font-size: 13px;
+}
+"""
+
 class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin, 
                           FileOperationsMixin, EditorActionsMixin):
+    css_provider = None
+    # Parsed shortcut triggers are immutable, so every window shares them:
+    # (trigger, action name) per SHORTCUT_ACCELS entry, then Escape's trigger
+    shortcut_triggers = None
+    escape_trigger = None
+
     def __init__(self, **kwargs):
         try:
             super().__init__(**kwargs)
@@ -1891,26 +2278,25 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
     def apply_saved_config(self):
         saved_language = self.config.get("language", "auto")
         if saved_language != "auto":
-            global _
-            _ = setup_locale(saved_language)
+            change_language_global(saved_language)
             self.current_language = saved_language
 
         dark_theme = self.config.get("dark_theme", False)
         self.apply_theme(dark_theme)
 
     def change_language(self, language_code):
-        global _
-        _ = setup_locale(language_code if language_code != "auto" else None)
+        change_language_global(language_code)
         self.config.set("language", language_code)
         self.current_language = language_code
 
         self.recreate_ui()
+        # Image placeholders in the preview are translated text
+        self.update_preview_with_new_style()
 
     def recreate_ui(self):
         """Recreate UI elements to apply new language"""
         if self.current_file:
-            filename = os.path.basename(self.current_file)
-            self.set_title(f"{filename} - {_('Markdown Editor')}")
+            self.update_title()
         else:
             self.set_title(_("Markdown Editor"))
         
@@ -1949,11 +2335,8 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
         # Update status bar labels - NUEVA SECCIÓN
         if hasattr(self, 'text_buffer'):
             # Trigger a refresh of the statistics with current language
-            text = self.text_buffer.get_text(
-                self.text_buffer.get_start_iter(),
-                self.text_buffer.get_end_iter(),
-                False
-            )
+            self.shown_stats = None
+            text = self.get_document_text()
             self.update_detailed_stats(text)
         else:
             # Update labels even without content
@@ -2050,6 +2433,9 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
             self.search_btn.connect("clicked", lambda x: self.toggle_search())
             header_bar.pack_start(self.search_btn)
             
+            # Shown only while a document is open
+            self.document_buttons = (self.new_btn, self.open_btn, self.save_btn, self.search_btn)
+            
             self.setup_menu_button(header_bar)
             
             # Create a vertical box for the main content
@@ -2264,12 +2650,11 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
                 btn.connect("clicked", callback)
             return btn
         
+        # Separators are set up through construct properties, in one call
         def add_separator():
-            sep = Gtk.Separator(orientation=Gtk.Orientation.VERTICAL)
-            sep.set_margin_start(6)
-            sep.set_margin_end(6)
-            sep.add_css_class("group-separator")
-            toolbar.append(sep)
+            toolbar.append(Gtk.Separator(orientation=Gtk.Orientation.VERTICAL,
+                                         margin_start=6, margin_end=6,
+                                         css_classes=["group-separator"]))
         
         toolbar.append(create_icon_button("format-text-bold-symbolic", _("Bold (Ctrl+B)"), 
                                         lambda x: self.insert_format("**", "**")))
@@ -2320,6 +2705,13 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
         headers_button.set_tooltip_text(_("Select header"))
         headers_button.add_css_class("super-compact-btn")
         headers_button.set_size_request(18, 18)
+        # The popover is built the first time the menu is opened
+        headers_button.set_create_popup_func(self.create_headers_popover)
+        return headers_button
+
+    def create_headers_popover(self, headers_button):
+        if headers_button.get_popover() is not None:
+            return
         
         popover = Gtk.Popover()
         popover_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
@@ -2342,7 +2734,6 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
         
         popover.set_child(popover_box)
         headers_button.set_popover(popover)
-        return headers_button
 
     def create_view_buttons(self):
         view_buttons_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
@@ -2400,6 +2791,11 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
         self.text_view.set_bottom_margin(15)
         
         self.text_buffer = self.text_view.get_buffer()
+        self.document_bytes = 0
+        self.word_count = 0
+        self.buffer_version = 0
+        self.text_buffer.connect("insert-text", self.on_buffer_insert_text)
+        self.text_buffer.connect("delete-range", self.on_buffer_delete_range)
         self.text_buffer.connect("changed", self.on_text_changed)
         
         self.setup_search_tags()
@@ -2413,22 +2809,24 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
         self.preview_scroll = Gtk.ScrolledWindow()
         self.preview_scroll.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
         
-        self.preview_label = Gtk.Label()
-        self.preview_label.set_wrap(True)
-        self.preview_label.set_wrap_mode(Pango.WrapMode.WORD)
-        self.preview_label.set_xalign(0)
-        self.preview_label.set_yalign(0)
-        self.preview_label.set_margin_start(25)
-        self.preview_label.set_margin_end(25)
-        self.preview_label.set_margin_top(20)
-        self.preview_label.set_margin_bottom(20)
-        self.preview_label.set_selectable(True)
+        # A read-only text view rather than a label: edits replace only the
+        # changed part of its buffer, and it lays out just the visible text
+        self.preview_view = Gtk.TextView()
+        self.preview_view.set_editable(False)
+        self.preview_view.set_cursor_visible(False)
+        self.preview_view.set_wrap_mode(Gtk.WrapMode.WORD)
+        self.preview_view.set_left_margin(25)
+        self.preview_view.set_right_margin(25)
+        self.preview_view.set_top_margin(20)
+        self.preview_view.set_bottom_margin(20)
+        self.preview_view.add_css_class("preview")
+        self.reset_preview_buffer()
         
         preview_click = Gtk.GestureClick()
         preview_click.connect("pressed", self.on_preview_clicked)
-        self.preview_label.add_controller(preview_click)
+        self.preview_view.add_controller(preview_click)
         
-        self.preview_scroll.set_child(self.preview_label)
+        self.preview_scroll.set_child(self.preview_view)
         self.paned.set_end_child(self.preview_scroll)
 
     def create_status_bar(self):
@@ -2446,10 +2844,8 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
         status_box.append(self.doc_status_label)
         
         def add_separator():
-            sep = Gtk.Separator(orientation=Gtk.Orientation.VERTICAL)
-            sep.set_margin_top(2)
-            sep.set_margin_bottom(2)
-            status_box.append(sep)
+            status_box.append(Gtk.Separator(orientation=Gtk.Orientation.VERTICAL,
+                                            margin_top=2, margin_bottom=2))
         
         add_separator()
         
@@ -2493,162 +2889,78 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
     def show_welcome_state(self):
         self.content_stack.set_visible_child_name("welcome")
         self.set_title(_("Markdown Editor"))
-        
-        for btn_name in ['new_btn', 'open_btn', 'save_btn', 'search_btn']:
-            if hasattr(self, btn_name):
-                getattr(self, btn_name).set_visible(False)
-        
-        print_action = self.get_application().lookup_action("print")
-        if print_action:
-            print_action.set_enabled(False)
+        self.set_document_actions_visible(False)
 
     def show_editor_state(self):
+        # Runs on every open and new document; only the first one after the
+        # welcome page has anything to change
+        if self.content_stack.get_visible_child_name() == "editor":
+            return
         self.content_stack.set_visible_child_name("editor")
-        
-        for btn_name in ['new_btn', 'open_btn', 'save_btn', 'search_btn']:
-            if hasattr(self, btn_name):
-                getattr(self, btn_name).set_visible(True)
+        self.set_document_actions_visible(True)
+
+    def set_document_actions_visible(self, visible):
+        for button in self.document_buttons:
+            button.set_visible(visible)
         
         print_action = self.get_application().lookup_action("print")
         if print_action:
-            print_action.set_enabled(True)
+            print_action.set_enabled(visible)
 
     def apply_css(self):
         if not Gtk or not Gdk:
             return
             
+        # One provider for the display serves every window; adding another
+        # per window would only make GTK match the same rules again
+        if MarkdownEditorWindow.css_provider is not None:
+            return
         css_provider = Gtk.CssProvider()
-        css_data = """
-        .welcome-card {
-            background-color: @window_bg_color;
-            border: 1px solid @borders;
-            border-radius: 12px;
-            box-shadow: 0 3px 10px rgba(0, 0, 0, 0.1);
-            margin: 20px;
-            padding: 40px;
-        }
-        
-        .welcome-card:hover {
-            box-shadow: 0 5px 20px rgba(0, 0, 0, 0.15);
-            transition: box-shadow 200ms ease-in-out;
-        }
-        
-        .super-compact-btn {
-            min-height: 18px;
-            min-width: 18px;
-            margin: 1px 2px;
-            border-radius: 2px;
-            transition: all 80ms ease-in-out;
-            border: none;
-            box-shadow: none;
-            padding: 1px;
-            background: transparent;
-        }
-        
-        .super-compact-btn:hover {
-            background-color: alpha(@accent_color, 0.15);
-        }
-        
-        .header-preview-btn {
-            padding: 0px 8px;
-            margin: 0px;
-            border-radius: 1px;
-            text-align: left;
-            min-height: 20px;
-            border: none;
-            background: transparent;
-        }
-        
-        .header-preview-btn:hover {
-            background-color: alpha(@accent_color, 0.1);
-        }
-        
-        .view-btn-active {
-            background-color: alpha(@accent_color, 0.2);
-            color: @accent_color;
-        }
-        
-        .group-separator {
-            margin: 2px 2px;
-            opacity: 0.4;
-            min-width: 1px;
-            min-height: 18px;
-            background: alpha(@borders, 0.5);
-        }
-        
-        .toolbar {
-            background: alpha(@headerbar_bg_color, 0.98);
-            border: none;
-            box-shadow: none;
-            padding: 1px 0px;
-        }
-        
-        .dim-label {
-            opacity: 0.75;
-            font-size: 12px;
-            font-family: monospace;
-            padding: 2px 4px;
-        }
-        
-        textview {
-            font-family: 'JetBrains Mono', 'Fira Code', 'Source Code Pro', 'Consolas', monospace;
-            font-size: 14px;
-            line-height: 1.5;
-        }
-        
-        label {
-            font-family: 'DejaVu Sans', 'Noto Sans', sans-serif;
-            font-size: 14px;
-            line-height: 1.6;
-        }
-        
-        separator {
-            border: none;
-            background: alpha(@borders, 0.3);
-            min-width: 1px;
-            min-height: 1px;
-        }
-        
-        .compact-entry {
-            min-height: 24px;
-            max-height: 24px;
-            padding: 2px 8px;
-            margin: 0px;
-            font-size: 13px;
-        }
-        """
-        
-        css_provider.load_from_data(css_data.encode())
+        css_provider.load_from_data(APP_CSS)
         Gtk.StyleContext.add_provider_for_display(
             Gdk.Display.get_default(),
             css_provider,
             Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
         )
+        MarkdownEditorWindow.css_provider = css_provider
 
     def setup_shortcuts(self):
         if not Gtk:
             return
             
         try:
-            controller = Gtk.ShortcutController()
-            
+            # Window actions, bound to their keys (SHORTCUT_ACCELS) below
             shortcuts = [
-                ("<Control>b", lambda *args: self.insert_format("**", "**")),
-                ("<Control>i", lambda *args: self.insert_format("*", "*")),
-                ("<Control>k", lambda *args: self.insert_format("[", "](https://)")),
-                ("<Control>n", lambda *args: self.on_new(None)),
-                ("<Control>o", lambda *args: self.on_open(None)),
-                ("<Control>s", lambda *args: self.on_save(None)),
-                ("<Control>f", lambda *args: self.toggle_search()),
-                ("Escape", lambda *args: self.hide_search()),
+                ("bold", lambda *args: self.insert_format("**", "**")),
+                ("italic", lambda *args: self.insert_format("*", "*")),
+                ("link", lambda *args: self.insert_format("[", "](https://)")),
+                ("new", lambda *args: self.on_new(None)),
+                ("open", lambda *args: self.on_open(None)),
+                ("save", lambda *args: self.on_save(None)),
+                ("search", lambda *args: self.toggle_search()),
             ]
             
-            for trigger_string, callback in shortcuts:
-                shortcut = Gtk.Shortcut()
-                shortcut.set_trigger(Gtk.ShortcutTrigger.parse_string(trigger_string))
-                shortcut.set_action(Gtk.CallbackAction.new(callback))
-                controller.add_shortcut(shortcut)
-            
+            for action_name, callback in shortcuts:
+                action = Gio.SimpleAction.new(action_name, None)
+                action.connect("activate", callback)
+                self.add_action(action)
+            
+            # Bubble phase: the focused widget (the search entry, an open
+            # popover) sees the key first, and keys pressed in dialogs never
+            # reach this window's controller
+            cls = MarkdownEditorWindow
+            if cls.shortcut_triggers is None:
+                cls.shortcut_triggers = tuple(
+                    (Gtk.ShortcutTrigger.parse_string(accel), action_name)
+                    for action_name, accel in SHORTCUT_ACCELS
+                )
+                cls.escape_trigger = Gtk.ShortcutTrigger.parse_string("Escape")
+            controller = Gtk.ShortcutController()
+            controller.set_propagation_phase(Gtk.PropagationPhase.BUBBLE)
+            for trigger, action_name in cls.shortcut_triggers:
+                controller.add_shortcut(Gtk.Shortcut.new(trigger, Gtk.NamedAction.new(action_name)))
+            controller.add_shortcut(Gtk.Shortcut.new(
+                cls.escape_trigger, Gtk.CallbackAction.new(lambda *args: self.hide_search())))
             self.add_controller(controller)
             
         except Exception as e:
@@ -2657,24 +2969,7 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
     def apply_render_style(self):
         style = self.config.get("render_style", "default")
         
-        if style == "github":
-            self.renderer = GitHubRenderer()
-        elif style == "github-light":
-            self.renderer = GitHubLightRenderer()
-        elif style == "github-dark":
-            self.renderer = GitHubDarkRenderer()
-        elif style == "gitlab":
-            self.renderer = GitLabRenderer()
-        elif style == "splendor":
-            self.renderer = SplendorRenderer()
-        elif style == "modest":
-            self.renderer = ModestRenderer()
-        elif style == "retro":
-            self.renderer = RetroRenderer()
-        elif style == "air":
-            self.renderer = AirRenderer()
-        else:
-            self.renderer = ImprovedRenderer()
+        self.renderer = RendererFactory.create_renderer(style)
         
         if hasattr(self, 'text_buffer'):
             self.update_preview_with_new_style()
@@ -2683,18 +2978,7 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
         if not hasattr(self, 'text_buffer'):
             return
             
-        text = self.text_buffer.get_text(
-            self.text_buffer.get_start_iter(),
-            self.text_buffer.get_end_iter(),
-            False
-        )
-        
-        preview_text = self.renderer.render_text(text)
-        try:
-            self.preview_label.set_markup(preview_text)
-        except Exception as e:
-            print(f"Error updating preview: {e}")
-            self.preview_label.set_text(text)
+        self.request_preview(self.get_document_text())
     
     def on_close(self, window):
         try:
@@ -2704,10 +2988,25 @@ class MarkdownEditorWindow(Adw.ApplicationWindow, ScrollSyncMixin, SearchMixin,
             width, height = self.get_default_size()
             self.config.set("window_width", width)
             self.config.set("window_height", height)
+            self.config.flush()
+            # Already saved, so this window's config is no longer flushed
+            # (or kept alive) at exit
+            atexit.unregister(self.config.flush)
             
         except Exception as e:
             print(f"Error saving configuration: {e}")
         
+        # A render still pending has no window left to show it in; the
+        # worker itself stays for the other windows
+        if getattr(self, 'preview_update_id', None):
+            GLib.source_remove(self.preview_update_id)
+            self.preview_update_id = None
+        if getattr(self, 'preview_future', None) is not None:
+            self.preview_future.cancel()
+            # A render already running cannot be cancelled; without a
+            # current request its result is dropped
+            self.preview_future = None
+        
         return False
 
 class MarkdownApp(Adw.Application):
@@ -2762,25 +3061,27 @@ class MarkdownApp(Adw.Application):
         if not hasattr(self.win, 'text_buffer'):
             return
             
-        text = self.win.text_buffer.get_text(
-            self.win.text_buffer.get_start_iter(),
-            self.win.text_buffer.get_end_iter(),
-            False
-        )
+        text = self.win.get_document_text()
         
         cairo_context = context.get_cairo_context()
         cairo_context.set_font_size(12)
         
-        lines = text.split('\n')
         y = 20
         line_height = 15
         
-        for line in lines:
+        # Lines are cut out of the text one at a time, only as many as fit
+        # on the page, instead of splitting the whole document
+        start = 0
+        while start <= len(text):
             if y > context.get_height() - 20:
                 break
+            end = text.find('\n', start)
+            if end == -1:
+                end = len(text)
             cairo_context.move_to(20, y)
-            cairo_context.show_text(line)
+            cairo_context.show_text(text[start:end])
             y += line_height
+            start = end + 1
     
     def on_language_changed(self, action, parameter):
         language_code = parameter.get_string()
@@ -2978,47 +3279,47 @@ class MarkdownApp(Adw.Application):
             print(f"Error activating application: {e}")
             traceback.print_exc()
 
+# Markup count_words drops (code, links, images) or unwraps (emphasis)
+WORD_COUNT_REMOVALS = [
+    (re.compile(r'```.*?```', re.DOTALL), ''),
+    (re.compile(r'`[^`]*`'), ''),
+    (re.compile(r'!?\[[^\]]*\]\([^)]*\)'), ''),
+    (re.compile(r'\*\*([^*]*)\*\*'), r'\1'),
+    (re.compile(r'\*([^*]*)\*'), r'\1'),
+    (re.compile(r'~~([^~]*)~~'), r'\1'),
+]
+ANCHOR_STRIP_RE = re.compile(r'[^\w\-]')
+# One to six hashes starting a line, with the title after them
+HEADER_LINE_RE = re.compile(r'^[^\S\n]*(#{1,6})(?!#)(.*)$', re.M)
+
 class MarkdownUtils:
     @staticmethod
     def extract_headers(text):
         headers = []
-        lines = text.split('\n')
-        
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if stripped.startswith('#'):
-                level = 0
-                for char in stripped:
-                    if char == '#':
-                        level += 1
-                    else:
-                        break
-                
-                if level <= 6:
-                    title = stripped[level:].strip()
-                    if title:
-                        headers.append({
-                            'level': level,
-                            'title': title,
-                            'line': i + 1
-                        })
+        # Line numbers are counted between matches, only up to each header
+        line = 1
+        pos = 0
+        
+        for match in HEADER_LINE_RE.finditer(text):
+            title = match.group(2).strip()
+            if title:
+                line += text.count('\n', pos, match.start())
+                pos = match.start()
+                headers.append({
+                    'level': len(match.group(1)),
+                    'title': title,
+                    'line': line
+                })
         
         return headers
     
     @staticmethod
     def count_words(text):
-        import re
-        text = re.sub(r'```.*?```', '', text, flags=re.DOTALL)
-        text = re.sub(r'`[^`]*`', '', text)
-        
-        text = re.sub(r'!?\[[^\]]*\]\([^)]*\)', '', text)
-        
-        text = re.sub(r'\*\*([^*]*)\*\*', r'\1', text)
-        text = re.sub(r'\*([^*]*)\*', r'\1', text)
-        text = re.sub(r'~~([^~]*)~~', r'\1', text)
+        for pattern, replacement in WORD_COUNT_REMOVALS:
+            text = pattern.sub(replacement, text)
         
-        words = [word for word in text.split() if word.strip()]
-        return len(words)
+        # split() never yields empty or blank words
+        return len(text.split())
     
     @staticmethod
     def estimate_reading_time(text, wpm=200):
@@ -3037,7 +3338,7 @@ class MarkdownUtils:
         for header in headers:
             indent = "  " * (header['level'] - 1)
             anchor = header['title'].lower().replace(' ', '-')
-            anchor = re.sub(r'[^\w\-]', '', anchor)
+            anchor = ANCHOR_STRIP_RE.sub('', anchor)
             toc.append(f"{indent}- [{header['title']}](#{anchor})")
         
         return "\n".join(toc) + "\n\n"
@@ -3067,25 +3368,82 @@ def run_basic_tests():
     
     word_count = utils.count_words(test_text)
     assert word_count > 0, "Word count should be greater than 0"
-    
+
+    # "``` text" does not close a fence, so the blank line after it stays
+    # inside the code block
+    blocks = split_markdown_blocks("```\ncode\n``` text\n\nstill code\n```\n\nafter")
+    assert blocks == ["```\ncode\n``` text\n\nstill code\n```\n", "after"], f"Unexpected blocks: {blocks}"
+
+    # cmark-gfm and python-markdown give the same preview for raw HTML
+    # and loose lists
+    renderer = ImprovedRenderer()
+    for sample, expected in (("<div>raw html</div>\n\ntext", "raw html"),
+                             ("1. a\n\n2. b\n", "1. a")):
+        outputs = []
+        if CMARKGFM_AVAILABLE:
+            outputs.append(renderer._html_to_pango(cmarkgfm.markdown_to_html_with_extensions(
+                sample, options=CMARK_OPTIONS, extensions=CMARK_EXTENSIONS)))
+        if MARKDOWN_AVAILABLE:
+            import markdown
+            outputs.append(renderer._html_to_pango(
+                markdown.Markdown(extensions=MARKDOWN_EXTENSIONS).convert(sample)))
+        for output in outputs:
+            assert expected in output, f"Expected {expected!r} in {output!r}"
+        assert len(set(outputs)) <= 1, f"Backends disagree: {outputs}"
+
+    # The lxml walk keeps text before the first element, like feed_markup
+    if LXML_AVAILABLE:
+        for html in ("</span>\nhello world", "a < b", "lead <b>x</b> tail"):
+            tokenized = HTMLToPangoParser("default")
+            tokenized.feed_markup(html)
+            walked = renderer._html_to_pango_uncached(html)
+            assert walked == tokenized.get_pango(), f"lxml output differs on {html!r}: {walked!r}"
+
+    # The regex tokenizer handles raw text and declarations like HTMLParser
+    for html in ("<script>if (a<b) {}</script><p>x</p>", "<style>a > b {}</style>",
+                 "<!DOCTYPE html><p>x</p>", "<![CDATA[y]]><p>x</p>", "<?php echo 1; ?><p>x</p>"):
+        tokenized = HTMLToPangoParser("default")
+        tokenized.feed_markup(html)
+        reference = HTMLToPangoParser("default")
+        reference.feed(html)
+        assert tokenized.get_pango() == reference.get_pango(), \
+            f"Tokenizer differs on {html!r}: {tokenized.get_pango()!r}"
+
     print("✓ All basic tests passed")
 
 class RendererFactory:
-    @staticmethod
-    def create_renderer(style_name):
-        renderers = {
-            "default": ImprovedRenderer,
-            "github": GitHubRenderer,
-            "github-light": GitHubLightRenderer,
-            "github-dark": GitHubDarkRenderer,
-            "gitlab": GitLabRenderer,
-            "splendor": SplendorRenderer,
-            "modest": ModestRenderer,
-            "retro": RetroRenderer,
-            "air": AirRenderer,
-        }
-        
-        renderer_class = renderers.get(style_name, ImprovedRenderer)
+    # One renderer per style, so switching back to a style finds its
+    # render caches still filled for the current document
+    _instances = {}
+    _classes = {
+        "default": ImprovedRenderer,
+        "github": GitHubRenderer,
+        "github-light": GitHubLightRenderer,
+        "github-dark": GitHubDarkRenderer,
+        "gitlab": GitLabRenderer,
+        "splendor": SplendorRenderer,
+        "modest": ModestRenderer,
+        "retro": RetroRenderer,
+        "air": AirRenderer,
+    }
+
+    @classmethod
+    def create_renderer(cls, style_name):
+        renderer = cls._instances.get(style_name)
+        if renderer is None:
+            renderer = cls._instances[style_name] = cls._new_renderer(style_name)
+        return renderer
+
+    @classmethod
+    def clear_caches(cls):
+        # Runs on the render worker while the main thread may add a
+        # renderer, so it walks a snapshot of the instances
+        for renderer in list(cls._instances.values()):
+            renderer.clear_caches()
+
+    @classmethod
+    def _new_renderer(cls, style_name):
+        renderer_class = cls._classes.get(style_name, ImprovedRenderer)
         return renderer_class()
     
     @staticmethod
@@ -3141,6 +3499,8 @@ MimeType=text/markdown;text/x-markdown;
         
         optional_deps = {
             'markdown': ('markdown', None),
+            'cmarkgfm': ('cmarkgfm', None),
+            'lxml': ('lxml', None),
         }
         
         print("Checking dependencies...")
@@ -3204,7 +3564,7 @@ class DebugUtils:
         renderer = ImprovedRenderer()
         
         start_time = time.time()
-        for _ in range(100):
+        for _unused in range(100):
             rendered = renderer.render_text(test_text)
         end_time = time.time()
         
@@ -3212,7 +3572,7 @@ class DebugUtils:
         
         utils = MarkdownUtils()
         start_time = time.time()
-        for _ in range(1000):
+        for _unused in range(1000):
             word_count = utils.count_words(test_text)
         end_time = time.time()
         